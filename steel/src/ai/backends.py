@@ -0,0 +1,165 @@
+import logging
+import os
+import cv2
+import numpy as np
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# columns of the per-frame detection array returned by every backend
+DETECTION_COLUMNS = ("x1", "y1", "x2", "y2", "conf", "cls")
+_EMPTY_DETECTIONS = np.empty((0, len(DETECTION_COLUMNS)), dtype=np.float32)
+
+
+class Detections:
+    """The subset of ultralytics' Boxes the trackers read (conf, cls, xywh), built from an (N, 6) array."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return Detections(self.data[index])
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def xywh(self):
+        xyxy = self.data[:, :4]
+        return np.concatenate([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5]
+
+
+def letterbox(frame, imgsz):
+    """Resize keeping the aspect ratio and pad to imgsz x imgsz, as ultralytics does; returns (image, ratio, pad)."""
+    h, w = frame.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (w, h) else frame
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    bottom, right = imgsz - new_h - top, imgsz - new_w - left
+    image = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, ratio, (left, top)
+
+
+def to_blob(images):
+    """BGR HWC uint8 images -> RGB NCHW float32 in [0, 1]."""
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+class TorchBackend:
+    """The ultralytics YOLO model on PyTorch (``.pt`` weights)."""
+
+    name = "torch"
+
+    def __init__(self, model_path, imgsz=640, conf=0.1, iou=0.7):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def predict(self, frames):
+        results = self.model.predict(frames, imgsz=self.imgsz, conf=self.conf, iou=self.iou, verbose=False)
+        return [np.asarray(result.boxes.data.cpu().numpy(), dtype=np.float32) for result in results]
+
+
+class OnnxBackend:
+    """A YOLO ONNX export (FP32 or INT8) on onnxruntime's CPU provider.
+
+    Pre- and post-processing (letterbox, confidence filter, per-class NMS)
+    follow ultralytics so that detections match the PyTorch model.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path, imgsz=640, conf=0.1, iou=0.7, threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # a static export fixes the batch size and image size
+        batch_dim, size_dim = model_input.shape[0], model_input.shape[2]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) else None
+        self.imgsz = size_dim if isinstance(size_dim, int) else imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def predict(self, frames):
+        step = self.max_batch or len(frames)
+        detections = []
+        for start in range(0, len(frames), step):
+            detections.extend(self._predict(frames[start:start + step]))
+        return detections
+
+    def _predict(self, frames):
+        prepared = [letterbox(frame, self.imgsz) for frame in frames]
+        output = self.session.run(None, {self.input_name: to_blob([image for image, _, _ in prepared])})[0]
+        return [
+            self._postprocess(pred, ratio, pad, frame.shape)
+            for pred, (_, ratio, pad), frame in zip(output, prepared, frames)
+        ]
+
+    def _postprocess(self, pred, ratio, pad, shape):
+        pred = pred.T  # (anchors, 4 + classes)
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+        keep = conf >= self.conf
+        if not keep.any():
+            return _EMPTY_DETECTIONS
+        xywh, conf, cls = pred[keep, :4], conf[keep], cls[keep]
+        # offset boxes per class so one NMS call never suppresses across classes
+        offset = (cls * 4096.0)[:, None]
+        nms_boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2 + offset, xywh[:, 2:]], axis=1)
+        idx = np.asarray(cv2.dnn.NMSBoxes(nms_boxes.tolist(), conf.tolist(), self.conf, self.iou), dtype=int).reshape(-1)
+        if not len(idx):
+            return _EMPTY_DETECTIONS
+        xywh, conf, cls = xywh[idx], conf[idx], cls[idx]
+        xyxy = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        xyxy -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+        xyxy /= ratio
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+        return np.concatenate([xyxy, conf[:, None], cls[:, None]], axis=1).astype(np.float32)
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend}
+
+
+def create_backend(model_path, kind=None, conf=None):
+    """Build the detector for ``model_path``; ``kind`` (or INFERENCE_BACKEND) "auto" picks it by file extension.
+
+    ``conf`` overrides INFERENCE_CONF as the score threshold.
+    """
+    kind = kind or settings.INFERENCE_BACKEND
+    if kind == "auto":
+        kind = "onnx" if os.path.splitext(model_path)[1].lower() == ".onnx" else "torch"
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{kind}'")
+    options = dict(imgsz=settings.INFERENCE_IMGSZ, conf=settings.INFERENCE_CONF if conf is None else conf, iou=settings.INFERENCE_IOU)
+    if kind == "onnx":
+        options["threads"] = settings.INFERENCE_THREADS
+    backend = BACKENDS[kind](model_path, **options)
+    logger.info(f"🧠 Inference backend {backend.name} for {model_path}")
+    return backend
@@ -1,28 +1,80 @@
-from ultralytics import YOLO
-import cv2
+import time
+import numpy as np
+from ai.inference import get_inference_engine
+from config.config import settings
 
 class IngotCounter:
-    def __init__(self, model_path, counting_line_x, rabbitmq_client, queue_name, match_threshold=5):
-        self.model = YOLO(model_path)
+    """Counts tracked ingots as they cross the vertical line at ``counting_line_x``.
+
+    A track counts once, on the first frame whose centroid is on the other
+    side of the line from where it was on the track's previous frame, so a
+    fast ingot that jumps over the line between two frames is still counted.
+    A track first seen within ``match_threshold`` px of the line counts too.
+    Per-track state (last centroid, counted flag) expires ``track_ttl``
+    seconds after the track was last seen, so memory stays flat over long
+    runs and each frame costs O(detections).
+    """
+
+    def __init__(self, model_path, counting_line_x, rabbitmq_client, queue_name, match_threshold=5, tracker_key=None,
+                 engine=None, track_ttl=None):
+        self.engine = engine or get_inference_engine(model_path)
+        self.tracker_key = tracker_key or queue_name
         self.counting_line_x = counting_line_x
         self.match_threshold = match_threshold
-        self.counted_ids = set()
+        self.track_ttl = track_ttl or settings.COUNTER_TRACK_TTL
+        # track id -> [last centroid x, last seen, counted]
+        self._tracks = {}
+        self._swept_at = None
         self.rabbitmq_client = rabbitmq_client
         self.queue_name = queue_name
 
-    def process_frame(self, frame):
-        results = self.model.track(frame, persist=True)
-        counted_ingots = []
-        for box in results[0].boxes:
-            if box.id is None:
-                continue
-            id = int(box.id.item())
-            x, y, w, h = box.xywh[0].tolist()
-            centroid_x = x
-            if abs(centroid_x - self.counting_line_x) <= self.match_threshold and id not in self.counted_ids:
-                counted_ingots.append((id, h, w))
-                self.counted_ids.add(id)
-        count = len(counted_ingots)
-        sizes = [size for _, size, _ in counted_ingots]
-        widths = [width for _, _, width in counted_ingots]
-        return count, sizes, widths, results
\ No newline at end of file
+    def process_frame(self, frame, now=None):
+        """Track and count one frame; ``now`` is its capture time (defaults to the current time)."""
+        return self._count(self.engine.track(self.tracker_key, frame), now)
+
+    def process_batch(self, frames, times=None):
+        """Run consecutive frames through one batched forward pass; one process_frame result per frame."""
+        results = self.engine.track_batch(self.tracker_key, frames)
+        times = times or [None] * len(results)
+        return [self._count(tracks, now) for tracks, now in zip(results, times)]
+
+    def _count(self, tracks, now=None):
+        now = time.time() if now is None else now
+        if not len(tracks):
+            self._expire(now)
+            return 0, [], [], tracks
+
+        ids = tracks[:, 4].astype(np.int64).tolist()
+        centroid_x = (tracks[:, 0] + tracks[:, 2]) * 0.5
+        states = [self._tracks.get(track_id) for track_id in ids]
+        prev_x = np.array([s[0] if s else np.nan for s in states], dtype=np.float32)
+        counted = np.array([bool(s and s[2]) for s in states])
+
+        line = self.counting_line_x
+        seen = ~np.isnan(prev_x)
+        with np.errstate(invalid="ignore"):
+            crossed = seen & (np.sign(prev_x - line) != np.sign(centroid_x - line))
+        on_line = ~seen & (np.abs(centroid_x - line) <= self.match_threshold)
+        new = (crossed | on_line) & ~counted
+
+        for track_id, x, is_counted, is_new in zip(ids, centroid_x.tolist(), counted.tolist(), new.tolist()):
+            self._tracks[track_id] = [x, now, is_counted or is_new]
+        self._expire(now)
+
+        hits = tracks[new]
+        sizes = (hits[:, 3] - hits[:, 1]).tolist()
+        widths = (hits[:, 2] - hits[:, 0]).tolist()
+        return len(hits), sizes, widths, tracks
+
+    def _expire(self, now):
+        """Drop tracks not seen for track_ttl; runs at most once per track_ttl."""
+        if self._swept_at is None:
+            self._swept_at = now
+        if now - self._swept_at < self.track_ttl:
+            return
+        cutoff = now - self.track_ttl
+        self._tracks = {track_id: state for track_id, state in self._tracks.items() if state[1] >= cutoff}
+        self._swept_at = now
+
+    def close(self):
+        self.engine.release(self.tracker_key)
@@ -0,0 +1,129 @@
+"""Export the YOLO weights to ONNX for onnxruntime, optionally with an INT8 copy.
+
+Run from steel/:
+
+    PYTHONPATH=src python -m ai.export_onnx src/ai/weights/best.pt
+    PYTHONPATH=src python -m ai.export_onnx src/ai/weights/best.pt --int8 --calibration sample/cam1_2.mp4
+
+writes best.onnx (FP32, dynamic batch) and best-int8.onnx next to the
+weights. Point YOLO_WEIGHTS at either file to use it; compare them first
+with ``python -m bench.backends``.
+
+INT8 uses static QDQ quantization calibrated on frames from the given clip
+or image directory. The detection head (the last ``/model.N/`` block) stays
+in FP32 by default, because quantizing its box regression costs far more
+accuracy than it saves time.
+"""
+import argparse
+import glob
+import logging
+import os
+import re
+import cv2
+from ai.backends import letterbox, to_blob
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def export_onnx(weights, imgsz=None, dynamic=True):
+    """Export ``weights`` with ultralytics; returns the .onnx path."""
+    from ultralytics import YOLO
+    return YOLO(weights).export(format="onnx", imgsz=imgsz or settings.INFERENCE_IMGSZ, dynamic=dynamic, simplify=True)
+
+
+def calibration_frames(source, count):
+    """Up to ``count`` frames spread evenly over a video or an image directory."""
+    if os.path.isdir(source):
+        paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp") for p in glob.glob(os.path.join(source, f"*.{ext}")))
+        step = max(1, len(paths) // count)
+        return [f for f in (cv2.imread(p) for p in paths[::step][:count]) if f is not None]
+    cap = cv2.VideoCapture(source)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    step = max(1, total // count) if total else 1
+    frames, index = [], 0
+    while len(frames) < count:
+        ok = cap.grab()
+        if not ok:
+            break
+        if index % step == 0:
+            ok, frame = cap.retrieve()
+            if ok:
+                frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def head_nodes(onnx_path):
+    """Names of the nodes in the last ``/model.N/`` block, i.e. the detection head."""
+    import onnx
+    names = [node.name for node in onnx.load(onnx_path).graph.node]
+    blocks = [int(m.group(1)) for m in (re.match(r"/model\.(\d+)/", name) for name in names) if m]
+    if not blocks:
+        return []
+    prefix = f"/model.{max(blocks)}/"
+    return [name for name in names if name.startswith(prefix)]
+
+
+def quantize_int8(onnx_path, frames, output_path, imgsz=None, keep_head_fp32=True):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnxruntime as ort
+
+    imgsz = imgsz or settings.INFERENCE_IMGSZ
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            return {input_name: to_blob([letterbox(frame, imgsz)[0]])}
+
+    prepared = output_path + ".prep.onnx"
+    quant_pre_process(onnx_path, prepared)
+    try:
+        quantize_static(
+            prepared, output_path, FrameReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            nodes_to_exclude=head_nodes(prepared) if keep_head_fp32 else None,
+        )
+    finally:
+        os.remove(prepared)
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("weights", nargs="?", default=settings.YOLO_WEIGHTS)
+    parser.add_argument("--imgsz", type=int, default=settings.INFERENCE_IMGSZ)
+    parser.add_argument("--static-batch", action="store_true", help="export with a fixed batch size of 1")
+    parser.add_argument("--int8", action="store_true", help="also write an INT8 model")
+    parser.add_argument("--calibration", help="video or image directory with representative frames (needed for --int8)")
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--quantize-head", action="store_true", help="quantize the detection head too")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.int8 and not args.calibration:
+        parser.error("--int8 needs --calibration")
+    onnx_path = export_onnx(args.weights, args.imgsz, dynamic=not args.static_batch)
+    logger.info(f"Exported {onnx_path}")
+    if args.int8:
+        frames = calibration_frames(args.calibration, args.calibration_frames)
+        if not frames:
+            raise SystemExit(f"No calibration frames could be read from {args.calibration}")
+        int8_path = os.path.splitext(onnx_path)[0] + "-int8.onnx"
+        quantize_int8(onnx_path, frames, int8_path, args.imgsz, keep_head_fp32=not args.quantize_head)
+        logger.info(f"Quantized {int8_path} with {len(frames)} calibration frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from ai.backends import Detections, create_backend
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# columns of the per-frame track array returned by InferenceEngine.track
+TRACK_COLUMNS = ("x1", "y1", "x2", "y2", "id", "conf", "cls")
+_EMPTY_TRACKS = np.empty((0, len(TRACK_COLUMNS)), dtype=np.float32)
+
+
+class _Request:
+    __slots__ = ("key", "frame", "result", "error", "done")
+
+    def __init__(self, key, frame):
+        self.key = key
+        self.frame = frame
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceEngine:
+    """One YOLO model per process, shared by every camera.
+
+    Callers submit frames with a tracker key (one per camera). A worker thread
+    gathers requests into micro-batches of up to ``max_batch`` frames, waiting
+    at most ``max_latency`` seconds after the first one, runs a single batched
+    forward pass and then updates each key's own tracker with its detections.
+    The detector is a pluggable backend (ai.backends); tracking stays here
+    and only sees (N, 6) detection arrays, whatever produced them. As with
+    ``model.track()``, detection runs at the tracker's ``track_low_thresh``:
+    BoT-SORT and ByteTrack match the low-scoring boxes to existing tracks in
+    a second pass, which keeps partly hidden ingots on their track ID.
+    """
+
+    def __init__(self, model_path, max_batch=8, max_latency=0.02, tracker_cfg="botsort.yaml", backend=None):
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+        self.tracker_args = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_cfg)))
+        self.backend = backend or create_backend(model_path, conf=self.tracker_args.track_low_thresh)
+        if getattr(self.backend, "conf", 0.0) > self.tracker_args.track_low_thresh:
+            logger.warning(
+                f"⚠️ Detector confidence {self.backend.conf} is above the tracker's track_low_thresh "
+                f"{self.tracker_args.track_low_thresh}; its second matching pass gets no boxes"
+            )
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._trackers = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="inference-engine")
+        self._thread.start()
+        self.batches = 0
+        self.frames = 0
+        logger.info(f"🧠 Inference engine loaded {model_path} (max_batch={max_batch}, max_latency={max_latency}s)")
+
+    def track(self, key, frame):
+        """Detect and track objects in ``frame``; blocks until its batch is done.
+
+        Returns an (N, 7) float array with columns TRACK_COLUMNS. Only boxes
+        that the tracker has assigned an ID are included.
+        """
+        req = _Request(key, frame)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def track_batch(self, key, frames):
+        """Like ``track`` for several consecutive frames of one key, submitted together.
+
+        All requests are queued before waiting, so the worker can put them
+        into the same forward pass; results come back in frame order.
+        """
+        reqs = [_Request(key, frame) for frame in frames]
+        for req in reqs:
+            self._queue.put(req)
+        results = []
+        for req in reqs:
+            req.done.wait()
+            if req.error is not None:
+                raise req.error
+            results.append(req.result)
+        return results
+
+    def release(self, key):
+        """Drop the tracker state kept for ``key``."""
+        self._trackers.pop(key, None)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _update_tracker(self, key, detections, frame):
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            from ultralytics.trackers.track import TRACKER_MAP
+            tracker = TRACKER_MAP[self.tracker_args.tracker_type](args=self.tracker_args, frame_rate=30)
+            self._trackers[key] = tracker
+        det = Detections(detections)
+        if len(det) == 0:
+            tracker.update(det, frame)
+            return _EMPTY_TRACKS
+        tracks = tracker.update(det, frame)
+        if len(tracks) == 0:
+            return _EMPTY_TRACKS
+        return np.asarray(tracks[:, :len(TRACK_COLUMNS)], dtype=np.float32)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                detections = self.backend.predict([req.frame for req in batch])
+                # requests for the same key stay in submission order, so trackers see frames in sequence
+                for req, dets in zip(batch, detections):
+                    req.result = self._update_tracker(req.key, dets, req.frame)
+                self.batches += 1
+                self.frames += len(batch)
+            except Exception as e:
+                logger.error(f"Inference batch of {len(batch)} failed: {e}")
+                for req in batch:
+                    req.error = e
+            for req in batch:
+                req.done.set()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_inference_engine(model_path):
+    """Return the process-wide engine for ``model_path``, loading the weights once."""
+    with _engines_lock:
+        engine = _engines.get(model_path)
+        if engine is None:
+            engine = InferenceEngine(
+                model_path,
+                max_batch=settings.INFERENCE_MAX_BATCH,
+                max_latency=settings.INFERENCE_MAX_LATENCY_MS / 1000.0,
+                tracker_cfg=settings.YOLO_TRACKER
+            )
+            _engines[model_path] = engine
+        return engine
@@ -0,0 +1,113 @@
+import logging
+from collections import Counter
+from ai.barcode import process_frame_for_barcode
+
+logger = logging.getLogger(__name__)
+
+
+class _TrackVotes:
+    __slots__ = ("votes", "reads", "committed", "last_seen", "best_reads")
+
+    def __init__(self, now):
+        self.votes = Counter()
+        self.reads = 0
+        self.committed = False
+        self.last_seen = now
+        # barcode -> (crop, read time, evidence) of its latest read
+        self.best_reads = {}
+
+
+class TrackBarcodeVoter:
+    """Ties barcode reads to YOLO track IDs and commits one barcode per ingot.
+
+    While a tracked ingot overlaps the barcode ``bbox``, OCR runs on the bbox
+    crop at most ``max_reads`` times for that track and each read is a vote.
+    The track commits as soon as one barcode has ``min_votes`` votes; after
+    that, or once its reads are used up, no more OCR runs for it. A track that
+    leaves without reaching ``min_votes`` commits its best read when it
+    expires, so a single clean read is not lost. Commits carry the time and
+    evidence of the read itself, not of the frame that triggered the commit,
+    which for an expired track no longer shows the ingot.
+    """
+
+    def __init__(self, bbox, max_reads=5, min_votes=2, track_ttl=5.0):
+        self.bbox = bbox
+        self.max_reads = max_reads
+        self.min_votes = min_votes
+        self.track_ttl = track_ttl
+        self._tracks = {}
+        self.ocr_calls = 0
+
+    def _overlap(self, x1, y1, x2, y2):
+        b = self.bbox
+        w = min(x2, b["x_max"]) - max(x1, b["x_min"])
+        h = min(y2, b["y_max"]) - max(y1, b["y_min"])
+        return w * h if w > 0 and h > 0 else 0
+
+    def _reader(self, tracks):
+        """Return the ID of the unfinished track covering most of the bbox, if any."""
+        best_id, best_area = None, 0
+        for x1, y1, x2, y2, track_id in tracks[:, :5].tolist():
+            track_id = int(track_id)
+            state = self._tracks[track_id]
+            if state.committed or state.reads >= self.max_reads:
+                continue
+            area = self._overlap(x1, y1, x2, y2)
+            if area > best_area:
+                best_id, best_area = track_id, area
+        return best_id
+
+    def _observe(self, tracks, now):
+        for track_id in tracks[:, 4].astype(int).tolist():
+            state = self._tracks.get(track_id)
+            if state is None:
+                state = self._tracks[track_id] = _TrackVotes(now)
+            state.last_seen = now
+
+    def _expire(self, now):
+        committed = []
+        for track_id, state in list(self._tracks.items()):
+            if now - state.last_seen <= self.track_ttl:
+                continue
+            if not state.committed and state.votes:
+                best, votes = state.votes.most_common(1)[0]
+                logger.info(f"Track {track_id} left with {votes}/{self.min_votes} votes for {best}, committing it")
+                committed.append((track_id, best) + state.best_reads[best])
+            del self._tracks[track_id]
+        return committed
+
+    def skip(self, tracks, now):
+        """Track bookkeeping for a frame that gets no OCR; returns the expiry commits, as ``update`` does.
+
+        ``tracks`` is None when YOLO was skipped as well. Without this, tracks
+        would not age while the consumer sheds OCR.
+        """
+        if tracks is not None:
+            self._observe(tracks, now)
+        return self._expire(now)
+
+    def update(self, frame, tracks, now, evidence=None):
+        """Feed one frame's tracks; return a list of (track_id, barcode, crop, read_at, evidence) committed now.
+
+        ``evidence`` is what callers want back with a commit for the frame
+        that was read (the frame itself by default); ``read_at`` is that
+        frame's ``now``.
+        """
+        self._observe(tracks, now)
+        committed = []
+        track_id = self._reader(tracks)
+        if track_id is not None:
+            state = self._tracks[track_id]
+            barcode, crop = process_frame_for_barcode(frame, self.bbox)
+            self.ocr_calls += 1
+            state.reads += 1
+            if barcode:
+                state.votes[barcode] += 1
+                state.best_reads[barcode] = (crop.copy(), now, frame if evidence is None else evidence)
+                best, votes = state.votes.most_common(1)[0]
+                if votes >= self.min_votes:
+                    state.committed = True
+                    committed.append((track_id, best) + state.best_reads[best])
+                    state.best_reads.clear()
+        committed.extend(self._expire(now))
+        return committed
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+import numpy as np
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+_status = {
+    "detector": {"state": "pending", "load_seconds": None, "warmup_seconds": None, "error": None},
+    "ocr": {"state": "pending", "load_seconds": None, "warmup_seconds": None, "error": None},
+}
+_status_lock = threading.Lock()
+
+
+def _set(name, **fields):
+    with _status_lock:
+        _status[name].update(fields)
+
+
+def _load(name, load, warm_up):
+    """Load a model (once per process; a consumer may already have done it) and run one dummy inference."""
+    _set(name, state="loading")
+    try:
+        t0 = time.perf_counter()
+        model = load()
+        t1 = time.perf_counter()
+        warm_up(model)
+        t2 = time.perf_counter()
+    except Exception as e:
+        _set(name, state="failed", error=str(e))
+        logger.error(f"❌ Loading {name} model failed: {e}")
+        return
+    _set(name, state="ready", load_seconds=round(t1 - t0, 3), warmup_seconds=round(t2 - t1, 3))
+    logger.info(f"🧠 {name} model loaded in {t1 - t0:.1f}s, warm-up inference {t2 - t1:.2f}s")
+
+
+def _warm_up_detector(engine):
+    size = settings.INFERENCE_IMGSZ
+    engine.track("__warmup__", np.zeros((size, size, 3), dtype=np.uint8))
+    engine.release("__warmup__")
+
+
+def _warm_up_ocr(ocr):
+    ocr.ocr(np.full((48, 320, 3), 255, dtype=np.uint8), cls=True)
+
+
+def warm_up_models():
+    """Load YOLO and PaddleOCR and run a dummy inference through each, recording timings for /ready."""
+    from ai.barcode import get_ocr
+    from ai.inference import get_inference_engine
+    started = time.perf_counter()
+    _load("detector", lambda: get_inference_engine(settings.YOLO_WEIGHTS), _warm_up_detector)
+    _load("ocr", get_ocr, _warm_up_ocr)
+    logger.info(f"🚀 Models warmed up in {time.perf_counter() - started:.1f}s")
+
+
+def start_warm_up():
+    """Warm the models up on a background thread so the API can serve /health meanwhile."""
+    thread = threading.Thread(target=warm_up_models, daemon=True, name="model-warmup")
+    thread.start()
+    return thread
+
+
+def model_status():
+    with _status_lock:
+        return {name: dict(fields) for name, fields in _status.items()}
+
+
+def models_ready():
+    with _status_lock:
+        return all(fields["state"] == "ready" for fields in _status.values())
@@ -1,22 +1,50 @@
-
-from fastapi import FastAPI, UploadFile, File, Form
+import time
+_import_started = time.perf_counter()
+import logging
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from threading import Thread, Event
 import tempfile
-import time
 import os
 from pydantic import BaseModel
 from capture.producer import camera_producer, video_producer
 from processing.frame_consumer import frame_consumer
+from processing.video_batch import VideoBatchJob
+from app.cluster import ClusterNode
+from app.supervisor import WorkerSupervisor
+from ai.warmup import model_status, models_ready, start_warm_up
 from config.config import settings
+from monitoring import metrics
+
+# models are not loaded by any of the imports above; that happens in the warm-up thread
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
+logger = logging.getLogger(__name__)
 app = FastAPI()
 active_processors = {}
+supervisor = None
+cluster_node = None
+started_at = None
 
 class CameraConfig(BaseModel):
     camera_id: str
 
 @app.on_event("startup")
 async def startup_event():
+    global supervisor, cluster_node, started_at
+    started_at = time.time()
+    logger.info(f"🚀 API modules imported in {IMPORT_SECONDS:.2f}s")
+    if settings.WORKER_MODE == "cluster":
+        start_warm_up()
+        cluster_node = ClusterNode(settings.CAMERAS)
+        cluster_node.start()
+        return
+    if settings.WORKER_MODE == "process":
+        supervisor = WorkerSupervisor(list(settings.CAMERAS.keys()))
+        supervisor.start()
+        return
+    start_warm_up()
     for camera_id in settings.CAMERAS.keys():
         if camera_id in active_processors:
             continue
@@ -38,28 +66,151 @@ async def startup_event():
         }
     print(f"Started processing for cameras: {list(settings.CAMERAS.keys())}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if supervisor:
+        await run_in_threadpool(supervisor.stop_all)
+    if cluster_node:
+        await run_in_threadpool(cluster_node.stop)
+
+@app.get("/health")
+async def health():
+    """Liveness: the API is serving, whatever state the models are in."""
+    return {"status": "ok", "uptime_seconds": round(time.time() - started_at, 1) if started_at else 0.0}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the models are loaded and warmed up and every camera pipeline is running, else 503."""
+    if supervisor:
+        status = await run_in_threadpool(supervisor.status)
+        is_ready = await run_in_threadpool(supervisor.ready)
+        body = {"ready": is_ready, "workers": status["workers"]}
+    elif cluster_node:
+        # both take the node's lock, which a tick may hold while it talks to the broker
+        is_ready = models_ready() and await run_in_threadpool(cluster_node.ready)
+        report = await run_in_threadpool(cluster_node.report)
+        body = {"ready": is_ready, "models": model_status(), "owned": report["owned"]}
+    else:
+        processors = {
+            camera_id: active_processors[camera_id]["consumer_thread"].is_alive()
+            for camera_id in settings.CAMERAS if camera_id in active_processors
+        }
+        is_ready = models_ready() and all(processors.values())
+        body = {"ready": is_ready, "models": model_status(), "processors": processors}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+@app.get("/workers")
+async def workers_status():
+    if not supervisor:
+        return {"error": "Worker mode is not enabled"}
+    return await run_in_threadpool(supervisor.status)
+
+@app.get("/cluster")
+async def cluster_status():
+    """Which node owns which camera producer and consumer."""
+    if not cluster_node:
+        return {"error": "Cluster mode is not enabled"}
+    return await run_in_threadpool(cluster_node.report)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # collectors take DB and supervisor locks; keep them off the event loop
+    return await run_in_threadpool(metrics.render)
+
 @app.post("/stop/{camera_id}")
 async def stop_camera(camera_id: str):
+    if supervisor and camera_id in supervisor:
+        await run_in_threadpool(supervisor.stop, camera_id)
+        return {"status": "stopped", "camera_id": camera_id}
     if camera_id not in active_processors:
         return {"error": "Camera not found"}
     proc = active_processors[camera_id]
     proc["stop_event"].set()
     proc["producer_thread"].join(timeout=5)
     proc["consumer_thread"].join(timeout=5)
+    if "temp_file" in proc:
+        _remove_temp_file(proc["temp_file"])
     del active_processors[camera_id]
     return {"status": "stopped", "camera_id": camera_id}
 
-@app.post("/start/video")
-async def start_video(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
-        temp_file.write(await file.read())
-        temp_path = temp_file.name
-    processor_id = f"video_{int(time.time())}"
+@app.get("/status/{processor_id}")
+async def processor_status(processor_id: str):
+    if supervisor and processor_id in supervisor:
+        return await run_in_threadpool(supervisor.status, processor_id)
+    proc = active_processors.get(processor_id)
+    if proc is None:
+        return {"error": "Processor not found"}
+    if "job" in proc:
+        return proc["job"].status()
+    return {
+        "processor_id": processor_id,
+        "state": "running" if proc["consumer_thread"].is_alive() else "finished"
+    }
+
+def _remove_temp_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _write_chunk(temp_file, chunk):
+    temp_file.write(chunk)
+    # make the data visible to a job already reading the partial file
+    temp_file.flush()
+
+async def _upload_chunks(file, chunk_size):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+async def _write_upload(chunks, temp_file):
+    """Copy an async stream of chunks to disk off the event loop, enforcing VIDEO_UPLOAD_MAX_MB."""
+    limit = settings.VIDEO_UPLOAD_MAX_MB * 1024 * 1024
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Video exceeds {settings.VIDEO_UPLOAD_MAX_MB} MB")
+        await run_in_threadpool(_write_chunk, temp_file, chunk)
+    return size
+
+def _check_content_length(request):
+    length = request.headers.get("content-length")
+    if length and int(length) > settings.VIDEO_UPLOAD_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"Video exceeds {settings.VIDEO_UPLOAD_MAX_MB} MB")
+
+def _start_video_processing(processor_id, temp_path, mode, upload_done=None):
+    """Start a batch job or the producer/consumer pair for a video; the temp file is removed when reading ends."""
     stop_event = Event()
-    producer_thread = Thread(
-        target=video_producer,
-        args=(temp_path, processor_id, stop_event)
-    )
+    if mode == "batch":
+        job = VideoBatchJob(processor_id, temp_path, settings.VIDEOS.get("video"), upload_done=upload_done)
+
+        def run_job():
+            try:
+                job.run(stop_event)
+            finally:
+                _remove_temp_file(temp_path)
+
+        job_thread = Thread(target=run_job, daemon=True)
+        job_thread.start()
+        active_processors[processor_id] = {
+            "producer_thread": job_thread,
+            "consumer_thread": job_thread,
+            "stop_event": stop_event,
+            "temp_file": temp_path,
+            "job": job
+        }
+        return
+
+    def produce():
+        try:
+            video_producer(temp_path, processor_id, stop_event)
+        finally:
+            _remove_temp_file(temp_path)
+
+    producer_thread = Thread(target=produce)
     consumer_thread = Thread(
         target=frame_consumer,
         args=(processor_id, temp_path, 'video', stop_event)
@@ -72,4 +223,50 @@ async def start_video(file: UploadFile = File(...)):
         "stop_event": stop_event,
         "temp_file": temp_path
     }
-    return {"status": "video processing started", "processor_id": processor_id}
\ No newline at end of file
+
+@app.post("/start/video")
+async def start_video(request: Request, file: UploadFile = File(...), mode: str = Form(None)):
+    _check_content_length(request)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    try:
+        await _write_upload(_upload_chunks(file, settings.VIDEO_UPLOAD_CHUNK_KB * 1024), temp_file)
+    except Exception:
+        temp_file.close()
+        _remove_temp_file(temp_file.name)
+        raise
+    temp_file.close()
+    processor_id = f"video_{int(time.time())}"
+    mode = mode or settings.VIDEO_MODE
+    _start_video_processing(processor_id, temp_file.name, mode)
+    return {"status": "video processing started", "processor_id": processor_id, "mode": mode}
+
+@app.post("/start/video/stream")
+async def start_video_stream(request: Request, mode: str = None):
+    """Upload a video as the raw request body (``curl -T shift.mp4 .../start/video/stream``).
+
+    Unlike the multipart route nothing is spooled before this handler runs,
+    and in batch mode analysis starts on the partial file while it arrives.
+    """
+    _check_content_length(request)
+    processor_id = f"video_{int(time.time())}"
+    mode = mode or settings.VIDEO_MODE
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    upload_done = Event()
+    if mode == "batch":
+        _start_video_processing(processor_id, temp_file.name, mode, upload_done)
+    try:
+        size = await _write_upload(request.stream(), temp_file)
+    except Exception:
+        # rejected or aborted upload: stop the early analysis and drop the partial file
+        proc = active_processors.pop(processor_id, None)
+        if proc:
+            proc["stop_event"].set()
+        temp_file.close()
+        _remove_temp_file(temp_file.name)
+        raise
+    finally:
+        upload_done.set()
+    temp_file.close()
+    if mode != "batch":
+        _start_video_processing(processor_id, temp_file.name, mode)
+    return {"status": "video processing started", "processor_id": processor_id, "mode": mode, "bytes": size}
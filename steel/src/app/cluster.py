@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from config.config import settings
+from monitoring.metrics import REGISTRY, COMPONENT_GAUGE
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("producer", "consumer")
+
+
+def default_node_id():
+    return settings.CLUSTER_NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def create_coordinator(node_id):
+    """The RabbitMQ coordinator, or the broker stand-in when CLUSTER_STANDIN_ADDRESS is set."""
+    if settings.CLUSTER_STANDIN_ADDRESS:
+        from rabbitmq.standin import StandInCoordinator
+        return StandInCoordinator(
+            node_id, settings.CLUSTER_STANDIN_ADDRESS, settings.CLUSTER_STANDIN_AUTHKEY, settings.CLUSTER_NODE_TIMEOUT
+        )
+    from rabbitmq.cluster import BrokerCoordinator
+    return BrokerCoordinator(node_id)
+
+
+def _score(node, key):
+    return int(hashlib.sha1(f"{node}/{key}".encode()).hexdigest()[:16], 16)
+
+
+def plan_owners(cameras, members):
+    """Place every (camera, role) on a live node that runs that role.
+
+    Rendezvous hashing with bounded load: each slot goes to its
+    highest-scoring candidate that still has room under an even share of
+    the roles, so nodes get similar loads even with few cameras and a
+    membership change mostly moves the slots of the node that came or went.
+    Only cameras on the rabbitmq transport can have their producer and
+    consumer on different nodes; the others are placed as one slot, and so
+    are dual-stream cameras, whose full-resolution evidence buffer lives in
+    the producer's process (capture.evidence). Every node computes the same
+    plan from the same members.
+    """
+    together = [node for node, info in members.items() if set(ROLES) <= set(info.get("roles", ()))]
+    slots = []
+    for camera_id, camera_info in cameras.items():
+        dual = camera_info.get("dual_stream", {}).get("enabled", False)
+        if camera_info.get("transport", settings.FRAME_TRANSPORT) == "rabbitmq" and not dual:
+            for role in ROLES:
+                candidates = [node for node, info in members.items() if role in info.get("roles", ())]
+                slots.append((f"{camera_id}.{role}", [(camera_id, role)], candidates))
+        else:
+            slots.append((camera_id, [(camera_id, role) for role in ROLES], together))
+    share = -(-len(cameras) * len(ROLES) // max(1, len(members)))
+    load = {node: 0 for node in members}
+    owners = {}
+    for key, roles, candidates in sorted(slots, key=lambda slot: slot[0]):
+        ranked = sorted(candidates, key=lambda node: _score(node, key), reverse=True)
+        owner = next((node for node in ranked if load[node] + len(roles) <= share), ranked[0] if ranked else None)
+        if owner is not None:
+            load[owner] += len(roles)
+        for slot in roles:
+            owners[slot] = owner
+    return owners
+
+
+class ThreadRoleRunner:
+    """Runs one camera role in a thread of this process, as the thread worker mode does."""
+
+    def __init__(self, camera_id, role):
+        from capture.producer import camera_producer
+        from processing.frame_consumer import frame_consumer
+        self.stop_event = threading.Event()
+        if role == "producer":
+            target, args = camera_producer, (camera_id, self.stop_event)
+        else:
+            target, args = frame_consumer, (camera_id, None, 'camera', self.stop_event)
+        self.thread = threading.Thread(target=target, args=args, daemon=True, name=f"{role}-{camera_id}")
+        self.thread.start()
+
+    def alive(self):
+        return self.thread.is_alive()
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        self.thread.join(timeout=timeout)
+
+
+class ClusterNode:
+    """One service instance's share of settings.CAMERAS.
+
+    Every ``heartbeat`` seconds the node renews its leases, announces the
+    roles it can run and the ones it owns, and recomputes the plan over the
+    live members: it claims (lease first, then starts) every camera role
+    planned onto it and stops and releases the ones planned elsewhere. A
+    role whose lease is lost or whose thread died is stopped and claimed
+    again on a later tick, so two nodes never run the same role at once.
+    Roles are stopped outside the lock, with the coordinator serviced
+    between them, and a lease is only released once its role has exited;
+    until then the role stays in ``stopping`` and is waited for again on
+    the next tick.
+    """
+
+    def __init__(self, cameras, coordinator=None, node_id=None, roles=None, runner=ThreadRoleRunner,
+                 heartbeat=None):
+        self.node_id = node_id or default_node_id()
+        self.cameras = cameras
+        self.coordinator = coordinator or create_coordinator(self.node_id)
+        roles = roles or settings.CLUSTER_ROLES
+        self.roles = [role.strip() for role in roles.split(",")] if isinstance(roles, str) else list(roles)
+        self.runner = runner
+        self.heartbeat = heartbeat or settings.CLUSTER_HEARTBEAT_SECONDS
+        self.running = {}
+        # (camera_id, role) -> (handle, release): told to stop, not exited yet
+        self.stopping = {}
+        self.members = {}
+        self.rebalances = 0
+        self.started_at = time.time()
+        # hear from the other nodes before claiming anything
+        self._settle_until = time.monotonic() + 2 * self.heartbeat
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="cluster-node")
+
+    @staticmethod
+    def lease_name(camera_id, role):
+        return f"{camera_id}.{role}"
+
+    def start(self):
+        REGISTRY.add_collector(self._collect)
+        self._thread.start()
+        logger.info(f"🚀 Cluster node {self.node_id} started with roles {self.roles}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"❌ Cluster node {self.node_id} tick failed: {e}")
+            self._stopping.wait(self.heartbeat)
+
+    def tick(self):
+        held = self.coordinator.renew()
+        with self._lock:
+            for (camera_id, role), handle in list(self.running.items()):
+                if self.lease_name(camera_id, role) not in held:
+                    logger.warning(f"⚠️ {self.node_id} lost the lease on {camera_id} {role}, stopping it")
+                    self._retire(camera_id, role, release=False)
+                elif not handle.alive():
+                    logger.warning(f"⚠️ {camera_id} {role} died on {self.node_id}, releasing it")
+                    self._retire(camera_id, role)
+            owned = sorted(self.lease_name(camera_id, role) for camera_id, role in self.running)
+        self._stop_retired()
+        self.coordinator.announce({"roles": self.roles, "owns": owned, "started_at": self.started_at})
+        members = self.coordinator.members()
+        members.setdefault(self.node_id, {"roles": self.roles, "owns": owned, "age_seconds": 0.0})
+        if set(members) != set(self.members):
+            logger.info(f"Cluster members: {sorted(members)}")
+            self.rebalances += 1
+        self.members = members
+        if time.monotonic() < self._settle_until:
+            return
+
+        with self._lock:
+            for (camera_id, role), owner in plan_owners(self.cameras, members).items():
+                mine = (camera_id, role) in self.running
+                if owner == self.node_id and not mine:
+                    # the previous run of this role must exit before it can start again
+                    if (camera_id, role) in self.stopping:
+                        continue
+                    if self.coordinator.acquire(self.lease_name(camera_id, role)):
+                        logger.info(f"🟢 {self.node_id} took {camera_id} {role}")
+                        self.running[(camera_id, role)] = self.runner(camera_id, role)
+                elif owner != self.node_id and mine:
+                    logger.info(f"{self.node_id} hands {camera_id} {role} over to {owner}")
+                    self._retire(camera_id, role)
+        self._stop_retired()
+
+    def _retire(self, camera_id, role, release=True):
+        """Move a role from running to stopping; called with the lock held."""
+        handle = self.running.pop((camera_id, role))
+        self.stopping[(camera_id, role)] = (handle, release)
+
+    def _stop_retired(self, timeout=None):
+        """Stop the roles in ``stopping``, without the lock, and release the leases of those that exited.
+
+        Each join waits at most a heartbeat, and the coordinator is serviced
+        after each one, so a slow role cannot starve the broker connection
+        that keeps the other leases; a role still running is retried on the
+        next tick with its lease kept.
+        """
+        with self._lock:
+            stopping = list(self.stopping.items())
+        for (camera_id, role), (handle, release) in stopping:
+            handle.stop(timeout=self.heartbeat if timeout is None else timeout)
+            self.coordinator.renew()
+            if handle.alive():
+                logger.warning(f"⚠️ {camera_id} {role} has not stopped on {self.node_id} yet, keeping its lease")
+                continue
+            if release:
+                self.coordinator.release(self.lease_name(camera_id, role))
+            with self._lock:
+                del self.stopping[(camera_id, role)]
+
+    def report(self):
+        """Which node owns which camera role, as the members announce it, plus this node's own view."""
+        with self._lock:
+            owned = sorted(self.lease_name(camera_id, role) for camera_id, role in self.running)
+            stopping = list(self.stopping)
+        members = dict(self.members)
+        if self.node_id in members:
+            members[self.node_id] = dict(members[self.node_id], owns=owned)
+        cameras = {camera_id: {role: None for role in ROLES} for camera_id in self.cameras}
+        for node, info in members.items():
+            for lease in info.get("owns", ()):
+                camera_id, role = lease.rsplit(".", 1)
+                if camera_id in cameras:
+                    cameras[camera_id][role] = node
+        return {
+            "node": self.node_id,
+            "roles": self.roles,
+            "owned": owned,
+            "members": members,
+            "cameras": cameras,
+            "unassigned": sorted(
+                self.lease_name(camera_id, role)
+                for camera_id, roles in cameras.items() for role, node in roles.items() if node is None
+            ),
+            "stopping": sorted(self.lease_name(camera_id, role) for camera_id, role in stopping),
+            "rebalances": self.rebalances,
+        }
+
+    def ready(self):
+        """True once this node runs everything the plan gives it."""
+        with self._lock:
+            running = dict(self.running)
+        planned = {slot for slot, owner in plan_owners(self.cameras, self.members).items() if owner == self.node_id}
+        return bool(self.members) and planned <= set(running) and all(handle.alive() for handle in running.values())
+
+    def _collect(self):
+        with self._lock:
+            running = set(self.running)
+        COMPONENT_GAUGE.set(len(self.members), "cluster", self.node_id, "members")
+        COMPONENT_GAUGE.set(len(running), "cluster", self.node_id, "owned_roles")
+        COMPONENT_GAUGE.set(self.rebalances, "cluster", self.node_id, "rebalances")
+
+    def stop(self):
+        """Stop every role and leave the cluster, releasing all leases."""
+        self._stopping.set()
+        self._thread.join(timeout=self.heartbeat + 5)
+        REGISTRY.remove_collector(self._collect)
+        with self._lock:
+            for camera_id, role in list(self.running):
+                self._retire(camera_id, role)
+        self._stop_retired(timeout=10)
+        if self.stopping:
+            logger.warning(f"⚠️ Roles still running on {self.node_id} as it leaves: {sorted(self.stopping)}")
+        # closing the coordinator drops whatever leases are left
+        self.coordinator.close()
+        logger.info(f"Cluster node {self.node_id} left the cluster")
@@ -0,0 +1,305 @@
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from config.config import settings
+from monitoring.metrics import REGISTRY, COMPONENT_GAUGE
+
+logger = logging.getLogger(__name__)
+
+# read by OpenMP/BLAS when torch, numpy and paddle load, so they are set before those imports
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def camera_worker(camera_id, cpus, threads, status_queue, stop_event):
+    """Worker process entry point: one camera's producer and consumer, with their own GIL.
+
+    Exits with status 0 when asked to stop and 1 when the consumer died on
+    its own, so the supervisor knows to restart it.
+    """
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    if threads:
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(threads)
+        settings.OCR_CPU_THREADS = threads
+        settings.INFERENCE_THREADS = threads
+    status_queue.put({"camera_id": camera_id, "pid": os.getpid(), "time": time.time(), "state": "starting"})
+
+    import cv2
+    from ai.warmup import models_ready, start_warm_up
+    from capture.producer import camera_producer
+    from processing.frame_consumer import frame_consumer
+    from monitoring.metrics import DROPPED_FRAMES, FRAMES_TOTAL
+    if threads:
+        cv2.setNumThreads(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    start_warm_up()
+    producer = threading.Thread(target=camera_producer, args=(camera_id, stop_event), daemon=True)
+    consumer = threading.Thread(target=frame_consumer, args=(camera_id, None, 'camera', stop_event), daemon=True)
+    producer.start()
+    consumer.start()
+    while consumer.is_alive() and not stop_event.is_set():
+        status_queue.put({
+            "camera_id": camera_id,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "state": "running",
+            "models_ready": models_ready(),
+            "frames_in": FRAMES_TOTAL.value(camera_id, "producer"),
+            "frames_out": FRAMES_TOTAL.value(camera_id, "consumer"),
+            "dropped": DROPPED_FRAMES.sum(camera_id),
+        })
+        stop_event.wait(settings.WORKER_HEARTBEAT_SECONDS)
+    stopping = stop_event.is_set()
+    stop_event.set()
+    producer.join(timeout=settings.WORKER_STOP_TIMEOUT)
+    consumer.join(timeout=settings.WORKER_STOP_TIMEOUT)
+    sys.exit(0 if stopping else 1)
+
+
+def plan_cpus(camera_ids):
+    """Cores for each camera: its own "cpus" list, else with WORKER_PIN_CPUS an equal slice of the usable cores."""
+    available = sorted(os.sched_getaffinity(0))
+    share = max(1, len(available) // max(1, len(camera_ids)))
+    plan = {}
+    for i, camera_id in enumerate(camera_ids):
+        cpus = settings.CAMERAS[camera_id].get("cpus")
+        if cpus is None and settings.WORKER_PIN_CPUS:
+            start = (i * share) % len(available)
+            cpus = available[start:start + share]
+        plan[camera_id] = list(cpus) if cpus else None
+    return plan
+
+
+class _Worker:
+    def __init__(self, camera_id, cpus, threads):
+        self.camera_id = camera_id
+        self.cpus = cpus
+        self.threads = threads
+        self.process = None
+        self.stop_event = None
+        # a stuck process being stopped outside the supervisor lock; no restart until it is gone
+        self.stopping = None
+        self.started_at = None
+        self.next_start = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.last_exit = None
+        self.heartbeat = {}
+        self.heartbeat_at = None
+        self.progress_at = None
+
+
+class WorkerSupervisor:
+    """Runs each camera pipeline in its own process and keeps it running.
+
+    A worker that exits, stops sending heartbeats for WORKER_HEARTBEAT_TIMEOUT
+    or processes no frame for WORKER_STALL_SECONDS is stopped and started
+    again after an exponential backoff (WORKER_BACKOFF_INITIAL_SECONDS,
+    doubling up to WORKER_BACKOFF_MAX_SECONDS; reset once a worker stays up
+    for WORKER_BACKOFF_RESET_SECONDS). Workers are spawned, not forked, so
+    no threads or model state leak in from the API process.
+    """
+
+    def __init__(self, camera_ids):
+        self._ctx = mp.get_context("spawn")
+        self._status_queue = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._workers = {}
+        for camera_id, cpus in plan_cpus(camera_ids).items():
+            threads = settings.CAMERAS[camera_id].get("threads", settings.WORKER_THREADS) or (len(cpus) if cpus else 0)
+            self._workers[camera_id] = _Worker(camera_id, cpus, threads)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="worker-supervisor")
+
+    def start(self):
+        with self._lock:
+            for worker in self._workers.values():
+                self._spawn(worker)
+        REGISTRY.add_collector(self._collect)
+        self._thread.start()
+        logger.info(f"Supervisor started workers for cameras: {list(self._workers)}")
+
+    def __contains__(self, camera_id):
+        return camera_id in self._workers
+
+    def _spawn(self, worker):
+        worker.stop_event = self._ctx.Event()
+        worker.process = self._ctx.Process(
+            target=camera_worker,
+            args=(worker.camera_id, worker.cpus, worker.threads, self._status_queue, worker.stop_event),
+            name=f"camera-{worker.camera_id}",
+            daemon=True
+        )
+        worker.process.start()
+        worker.started_at = worker.heartbeat_at = worker.progress_at = time.time()
+        logger.info(
+            f"Started worker for {worker.camera_id} (pid {worker.process.pid}, cpus {worker.cpus}, "
+            f"threads {worker.threads or 'default'})"
+        )
+
+    @staticmethod
+    def _terminate(camera_id, process, stop_event):
+        """Stop one worker process and return its exit code; joins, so never call it holding the lock."""
+        stop_event.set()
+        process.join(timeout=settings.WORKER_STOP_TIMEOUT)
+        if process.is_alive():
+            logger.warning(f"Worker for {camera_id} did not stop, terminating pid {process.pid}")
+            process.terminate()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        return process.exitcode
+
+    def _drain_status(self):
+        while True:
+            try:
+                beat = self._status_queue.get_nowait()
+            except queue.Empty:
+                return
+            worker = self._workers.get(beat["camera_id"])
+            if worker is None or worker.process is None or beat["pid"] != worker.process.pid:
+                continue
+            if beat.get("frames_out") != worker.heartbeat.get("frames_out"):
+                worker.progress_at = beat["time"]
+            worker.heartbeat = beat
+            worker.heartbeat_at = beat["time"]
+
+    def _hang_reason(self, worker, now):
+        if now - worker.heartbeat_at > settings.WORKER_HEARTBEAT_TIMEOUT:
+            return f"no heartbeat for {now - worker.heartbeat_at:.0f}s"
+        if settings.WORKER_STALL_SECONDS and now - worker.progress_at > settings.WORKER_STALL_SECONDS:
+            return f"no frames processed for {now - worker.progress_at:.0f}s"
+        return None
+
+    def _check(self, worker, now):
+        """Update one worker's state; a stuck worker is handed back as (process, stop_event) to stop outside the lock."""
+        to_stop = None
+        if worker.process is not None:
+            if worker.process.is_alive():
+                reason = self._hang_reason(worker, now)
+                if reason is None:
+                    return None
+                logger.error(f"❌ Worker for {worker.camera_id} is stuck ({reason}), restarting it")
+                to_stop = worker.stopping = (worker.process, worker.stop_event)
+            else:
+                logger.error(f"❌ Worker for {worker.camera_id} exited with code {worker.process.exitcode}")
+            worker.last_exit = worker.process.exitcode
+            # a worker that stayed up long enough starts the backoff over
+            if now - worker.started_at >= settings.WORKER_BACKOFF_RESET_SECONDS:
+                worker.failures = 0
+            worker.failures += 1
+            delay = min(
+                settings.WORKER_BACKOFF_MAX_SECONDS,
+                settings.WORKER_BACKOFF_INITIAL_SECONDS * 2 ** (worker.failures - 1)
+            )
+            worker.next_start = now + delay
+            worker.process = None
+            worker.heartbeat = {}
+            logger.warning(f"⚠️ Restarting worker for {worker.camera_id} in {delay:.0f}s (failure {worker.failures})")
+        if now >= worker.next_start and worker.stopping is None:
+            worker.restarts += 1
+            self._spawn(worker)
+        return to_stop
+
+    def _run(self):
+        while not self._stopping.wait(1.0):
+            to_stop = []
+            with self._lock:
+                self._drain_status()
+                now = time.time()
+                for worker in list(self._workers.values()):
+                    try:
+                        stuck = self._check(worker, now)
+                    except Exception as e:
+                        logger.error(f"Supervisor check for {worker.camera_id} failed: {e}")
+                        continue
+                    if stuck:
+                        to_stop.append((worker, stuck))
+            # joins take up to WORKER_STOP_TIMEOUT; status(), /ready and metrics must not wait for them
+            for worker, (process, stop_event) in to_stop:
+                try:
+                    exitcode = self._terminate(worker.camera_id, process, stop_event)
+                except Exception as e:
+                    logger.error(f"Stopping the stuck worker for {worker.camera_id} failed: {e}")
+                    exitcode = None
+                with self._lock:
+                    worker.last_exit = exitcode
+                    worker.stopping = None
+
+    def _worker_status(self, worker, now):
+        alive = worker.process is not None and worker.process.is_alive()
+        beat = worker.heartbeat
+        return {
+            "camera_id": worker.camera_id,
+            "state": beat.get("state", "starting") if alive else ("stopping" if worker.stopping else "backoff"),
+            "pid": worker.process.pid if worker.process else None,
+            "alive": alive,
+            "uptime_seconds": round(now - worker.started_at, 1) if alive else 0.0,
+            "restarts": worker.restarts,
+            "last_exit_code": worker.last_exit,
+            "restart_in_seconds": None if alive else round(max(0.0, worker.next_start - now), 1),
+            "heartbeat_age_seconds": round(now - worker.heartbeat_at, 1) if alive else None,
+            "cpus": worker.cpus,
+            "threads": worker.threads,
+            "models_ready": bool(beat.get("models_ready")) if alive else False,
+            "frames_in": beat.get("frames_in", 0),
+            "frames_out": beat.get("frames_out", 0),
+            "dropped": beat.get("dropped", 0),
+        }
+
+    def status(self, camera_id=None):
+        """Status of one worker, or of all of them with totals."""
+        with self._lock:
+            self._drain_status()
+            now = time.time()
+            if camera_id is not None:
+                worker = self._workers.get(camera_id)
+                return self._worker_status(worker, now) if worker else None
+            workers = [self._worker_status(worker, now) for worker in self._workers.values()]
+        return {
+            "workers": workers,
+            "alive": sum(w["alive"] for w in workers),
+            "restarts": sum(w["restarts"] for w in workers),
+            "frames_out": sum(w["frames_out"] for w in workers),
+            "dropped": sum(w["dropped"] for w in workers),
+        }
+
+    def ready(self):
+        """True once every worker is up and has its models loaded."""
+        workers = self.status()["workers"]
+        return bool(workers) and all(w["alive"] and w["models_ready"] for w in workers)
+
+    def _collect(self):
+        for status in self.status()["workers"]:
+            for stat in ("alive", "restarts", "frames_in", "frames_out", "dropped"):
+                COMPONENT_GAUGE.set(int(status[stat]), "worker", status["camera_id"], stat)
+
+    def stop(self, camera_id):
+        """Stop one camera's worker for good."""
+        with self._lock:
+            worker = self._workers.pop(camera_id, None)
+            running = (worker.process, worker.stop_event) if worker and worker.process is not None else None
+            stuck = worker.stopping if worker else None
+        if running:
+            self._terminate(camera_id, *running)
+        if stuck:
+            # the supervisor thread is stopping it already
+            stuck[0].join(timeout=settings.WORKER_STOP_TIMEOUT + 5)
+        return worker is not None
+
+    def stop_all(self):
+        self._stopping.set()
+        REGISTRY.remove_collector(self._collect)
+        for camera_id in list(self._workers):
+            self.stop(camera_id)
@@ -0,0 +1,126 @@
+"""Accuracy vs speed of YOLO inference backends on a recorded clip.
+
+Run from steel/:
+
+    PYTHONPATH=src python -m bench.backends sample/cam1_2.mp4 \\
+        src/ai/weights/best.pt src/ai/weights/best.onnx src/ai/weights/best-int8.onnx
+
+The first model is the reference. For every model the report shows load
+time, detector ms/frame and fps at the inference batch size, how well its
+detections agree with the reference (precision/recall/F1 at IoU 0.5, same
+class), and the ingot count of the full tracker + counting-line pipeline,
+which is the number that must not change. Pick the fastest backend whose
+count matches the reference.
+"""
+import argparse
+import json
+import logging
+import time
+
+# first: bench.replay fills in the SQL Server settings the config requires
+from bench.replay import load_frames
+import numpy as np
+from ai.backends import create_backend
+from ai.counter import IngotCounter
+from ai.inference import InferenceEngine
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def matched_detections(ref, pred, iou_threshold=0.5):
+    """Greedy one-to-one matching of two (N, 6) detection arrays by IoU; returns the number of matches."""
+    if not len(ref) or not len(pred):
+        return 0
+    a, b = ref[:, None, :4], pred[None, :, :4]
+    wh = np.clip(np.minimum(a[..., 2:], b[..., 2:]) - np.maximum(a[..., :2], b[..., :2]), 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-9)
+    iou[ref[:, None, 5] != pred[None, :, 5]] = 0
+    matches = 0
+    while True:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        if iou[i, j] < iou_threshold:
+            return matches
+        matches += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+
+
+def evaluate(model_path, frames, batch, counting_line_x, kind=None):
+    t0 = time.perf_counter()
+    backend = create_backend(model_path, kind)
+    load_seconds = time.perf_counter() - t0
+    backend.predict(frames[:batch])  # warm-up: allocations, kernel selection
+
+    detections = []
+    t0 = time.perf_counter()
+    for start in range(0, len(frames), batch):
+        detections.extend(backend.predict(frames[start:start + batch]))
+    detect_seconds = time.perf_counter() - t0
+
+    engine = InferenceEngine(model_path, max_batch=batch, max_latency=settings.INFERENCE_MAX_LATENCY_MS / 1000.0,
+                             tracker_cfg=settings.YOLO_TRACKER, backend=backend)
+    counter = IngotCounter(model_path, counting_line_x, None, f"bench_{model_path}", engine=engine)
+    ingots = 0
+    for start in range(0, len(frames), batch):
+        ingots += sum(count for count, _, _, _ in counter.process_batch(frames[start:start + batch]))
+    counter.close()
+
+    return {
+        "model": model_path,
+        "backend": backend.name,
+        "load_seconds": load_seconds,
+        "ms_per_frame": detect_seconds / len(frames) * 1000,
+        "fps": len(frames) / detect_seconds,
+        "ingots": ingots,
+        "detections": detections,
+    }
+
+
+def agreement(reference, detections):
+    matches = sum(matched_detections(r, d) for r, d in zip(reference, detections))
+    ref_total = sum(len(r) for r in reference)
+    pred_total = sum(len(d) for d in detections)
+    precision = matches / pred_total if pred_total else 1.0
+    recall = matches / ref_total if ref_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="video file or directory of frame images")
+    parser.add_argument("models", nargs="+", help="weights to compare; the first one is the reference")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=settings.INFERENCE_MAX_BATCH)
+    parser.add_argument("--counting-line-x", type=int, default=settings.DEFAULT_COUNTING_LINE_X)
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    frames = load_frames(args.source, args.frames)
+    results = [evaluate(path, frames, args.batch, args.counting_line_x) for path in args.models]
+    reference = results[0]
+    reference_detections = reference["detections"]
+    for result in results:
+        result.update(agreement(reference_detections, result.pop("detections")))
+        result["speedup"] = result["fps"] / reference["fps"]
+        result["count_delta"] = result["ingots"] - reference["ingots"]
+
+    print(f"\n{len(frames)} frames from {args.source}, batch {args.batch}, reference {reference['model']}")
+    print(f"{'model':<40}{'backend':>8}{'load s':>8}{'ms/frame':>10}{'fps':>8}{'speedup':>9}"
+          f"{'prec':>7}{'recall':>7}{'F1':>7}{'ingots':>8}{'delta':>7}")
+    for r in results:
+        print(f"{r['model']:<40}{r['backend']:>8}{r['load_seconds']:>8.1f}{r['ms_per_frame']:>10.1f}{r['fps']:>8.1f}"
+              f"{r['speedup']:>8.2f}x{r['precision']:>7.3f}{r['recall']:>7.3f}{r['f1']:>7.3f}"
+              f"{r['ingots']:>8}{r['count_delta']:>+7}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
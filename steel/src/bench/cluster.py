@@ -0,0 +1,211 @@
+"""Local cluster-mode test: several node processes sharing cameras through a broker stand-in.
+
+Starts the broker stand-in (rabbitmq/standin.py) and ``--nodes`` node
+processes running the real ClusterNode planning and lease logic, with idle
+role runners in place of the camera pipelines, so no camera, model or
+RabbitMQ server is needed. It then checks that
+
+1. the nodes converge on the planned owner for every camera producer and
+   consumer, each holding the lease of what it runs,
+2. the roles of a killed node are taken over once its leases expire,
+3. a node joining later receives its share of the roles,
+4. nodes that stop cleanly release everything.
+
+Each phase reports how long convergence took.
+
+Every other camera is on the rabbitmq transport, so its producer and
+consumer may be placed on different nodes; the rest keep both together.
+
+Run from steel/:
+
+    PYTHONPATH=src python -m bench.cluster --nodes 3 --cameras 6
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import socket
+import sys
+import time
+
+# settings insists on SQL Server credentials; nothing here connects
+for _key in ("DB_SERVER", "DB_NAME", "USERNAME", "PASSWORD"):
+    os.environ.setdefault(_key, "bench")
+
+from app.cluster import ClusterNode, plan_owners
+from rabbitmq.standin import StandInCoordinator, connect_board, serve_standin
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY = "steel-bench"
+
+
+class IdleRunner:
+    """Stands in for a camera role; the test is about who runs what, not the pipeline."""
+
+    def __init__(self, camera_id, role):
+        self.camera_id, self.role = camera_id, role
+        self.stopped = False
+
+    def alive(self):
+        return not self.stopped
+
+    def stop(self, timeout=None):
+        self.stopped = True
+
+
+def fake_cameras(count):
+    return {
+        f"cam{i}": {"transport": "rabbitmq" if i % 2 else "shm"}
+        for i in range(1, count + 1)
+    }
+
+
+def node_main(node_id, address, cameras, heartbeat, node_timeout, stop_event):
+    logging.basicConfig(level=logging.WARNING, format=f"%(asctime)s {node_id} %(message)s")
+    coordinator = StandInCoordinator(node_id, address, AUTHKEY, node_timeout)
+    node = ClusterNode(cameras, coordinator=coordinator, node_id=node_id, runner=IdleRunner, heartbeat=heartbeat)
+    node.start()
+    stop_event.wait()
+    node.stop()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(board, timeout, condition):
+    """Poll the stand-in's leases until ``condition(leases)`` holds; returns (leases, seconds) or (leases, None)."""
+    started = time.monotonic()
+    while True:
+        leases = board.leases()
+        if condition(leases):
+            return leases, time.monotonic() - started
+        if time.monotonic() - started > timeout:
+            return leases, None
+        time.sleep(0.05)
+
+
+def converged(board, cameras, nodes, node_timeout):
+    """Condition: exactly ``nodes`` are members and every role is leased by its planned owner."""
+    def check(leases):
+        members = board.members(node_timeout)
+        if set(members) != set(nodes):
+            return False
+        plan = {ClusterNode.lease_name(camera_id, role): owner
+                for (camera_id, role), owner in plan_owners(cameras, members).items()}
+        return leases == plan
+    return check
+
+
+def print_owners(leases, cameras):
+    print(f"  {'camera':<8} {'transport':<9} {'producer':<8} {'consumer':<8}")
+    for camera_id, info in cameras.items():
+        print(
+            f"  {camera_id:<8} {info['transport']:<9} "
+            f"{leases.get(camera_id + '.producer', '-'):<8} {leases.get(camera_id + '.consumer', '-'):<8}"
+        )
+    per_node = {}
+    for owner in leases.values():
+        per_node[owner] = per_node.get(owner, 0) + 1
+    print(f"  roles per node: {dict(sorted(per_node.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--cameras", type=int, default=6)
+    parser.add_argument("--heartbeat", type=float, default=0.2, help="node heartbeat / tick seconds")
+    parser.add_argument("--node-timeout", type=float, default=1.0, help="seconds without a heartbeat before a node is dropped")
+    parser.add_argument("--lease", type=float, default=1.5, help="stand-in lease expiry seconds")
+    parser.add_argument("--timeout", type=float, default=20.0, help="seconds each phase may take")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    cameras = fake_cameras(args.cameras)
+    port = free_port()
+    address = f"127.0.0.1:{port}"
+    standin = ctx.Process(target=serve_standin, args=("127.0.0.1", port, AUTHKEY, args.lease), daemon=True)
+    standin.start()
+    board = None
+    for _ in range(100):
+        try:
+            board = connect_board(address, AUTHKEY)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            time.sleep(0.05)
+    if board is None:
+        print("broker stand-in did not start")
+        return 1
+
+    nodes = {}
+
+    def start_node(node_id):
+        stop_event = ctx.Event()
+        process = ctx.Process(
+            target=node_main, args=(node_id, address, cameras, args.heartbeat, args.node_timeout, stop_event),
+            daemon=True,
+        )
+        process.start()
+        nodes[node_id] = (process, stop_event)
+
+    failures = []
+    try:
+        for i in range(1, args.nodes + 1):
+            start_node(f"node{i}")
+        live = set(nodes)
+        leases, seconds = wait_for(board, args.timeout, converged(board, cameras, live, args.node_timeout))
+        print(f"1. initial assignment: {'%.2fs' % seconds if seconds is not None else 'TIMED OUT'}")
+        print_owners(leases, cameras)
+        if seconds is None:
+            failures.append("initial assignment")
+
+        victim = "node1"
+        nodes[victim][0].kill()
+        live.discard(victim)
+        lost = {name for name, owner in leases.items() if owner == victim}
+        leases, seconds = wait_for(board, args.timeout, converged(board, cameras, live, args.node_timeout))
+        print(f"2. {victim} killed ({len(lost)} roles): taken over in "
+              f"{'%.2fs' % seconds if seconds is not None else 'TIMED OUT'}")
+        print_owners(leases, cameras)
+        if seconds is None:
+            failures.append("failover")
+
+        joiner = f"node{args.nodes + 1}"
+        before = dict(leases)
+        start_node(joiner)
+        live.add(joiner)
+        leases, seconds = wait_for(board, args.timeout, converged(board, cameras, live, args.node_timeout))
+        moved = sum(1 for name, owner in leases.items() if before.get(name) != owner)
+        print(f"3. {joiner} joined: {moved} roles moved in {'%.2fs' % seconds if seconds is not None else 'TIMED OUT'}")
+        print_owners(leases, cameras)
+        if seconds is None:
+            failures.append("join")
+
+        for process, stop_event in nodes.values():
+            # setting an Event a killed process was waiting on blocks forever
+            if process.is_alive():
+                stop_event.set()
+        for process, _ in nodes.values():
+            process.join(timeout=args.timeout)
+        leases, seconds = wait_for(board, args.timeout, lambda l: not l)
+        print(f"4. clean shutdown: {'all leases released' if seconds is not None else f'{len(leases)} leases left'}")
+        if seconds is None:
+            failures.append("shutdown")
+    finally:
+        for process, _ in nodes.values():
+            if process.is_alive():
+                process.kill()
+        standin.kill()
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
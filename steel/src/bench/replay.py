@@ -0,0 +1,327 @@
+"""Offline replay benchmark: recorded frames -> transport -> frame_consumer -> SQLite.
+
+Runs the real producer/consumer code paths in one process with no broker,
+SQL Server or GPU. Frames come from a video file or a directory of images
+and are published through the configured transport ("memory" is the broker
+code path against an in-process queue, "shm" the shared-memory ring). The
+consumer writes to a throwaway SQLite database only, and YOLO/OCR can be
+replaced with fixed-latency stubs so runs are comparable on any box.
+
+Run from steel/ (model paths are relative to it, as in the container):
+
+    PYTHONPATH=src python -m bench.replay sample/cam1_2.mp4 --frames 500 --save bench.json
+    PYTHONPATH=src python -m bench.replay sample/cam1_2.mp4 --frames 500 --compare bench.json
+
+Each run measures one configuration (its ``--label``); a baseline file keeps
+one entry per label so several configurations can share it.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+# settings insists on SQL Server credentials; the benchmark never connects
+for _key in ("DB_SERVER", "DB_NAME", "USERNAME", "PASSWORD"):
+    os.environ.setdefault(_key, "bench")
+
+import cv2
+import numpy as np
+from config.config import settings
+from db.database import DatabaseLogger
+from db.write_behind import WriteBehindLogger
+from monitoring.metrics import DROPPED_FRAMES, FRAMES_TOTAL, STAGE_SECONDS, observe_stage
+from processing.frame_consumer import frame_consumer
+from transport.factory import create_transport
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.bmp")
+
+
+class StubCounter:
+    """IngotCounter stand-in: sleeps ``latency`` per frame and reports one ingot every ``every`` frames.
+
+    A single full-frame track is returned; its ID changes with every ingot,
+    so the barcode voter sees one track per ingot as it would in production.
+    """
+
+    def __init__(self, counting_line_x, latency=0.03, every=25):
+        self.counting_line_x = counting_line_x
+        self.latency = latency
+        self.every = max(1, every)
+        self.frames = 0
+
+    def process_frame(self, frame, now=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.frames += 1
+        h, w = frame.shape[:2]
+        track_id = self.frames // self.every
+        tracks = np.array([[0, 0, w, h, track_id, 0.9, 0]], dtype=np.float32)
+        if self.frames % self.every == 0:
+            return 1, [float(h)], [float(w)], tracks
+        return 0, [], [], tracks
+
+    def close(self):
+        pass
+
+
+class StubOCR:
+    """PaddleOCR stand-in with a fixed latency that always reads the same 8-digit barcode."""
+
+    def __init__(self, latency=0.05, text="10000001"):
+        self.latency = latency
+        self.text = text
+        self.calls = 0
+
+    def ocr(self, img, cls=True):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [[[None, (self.text, 0.99)]]]
+
+
+def load_frames(source, limit, resize=None):
+    """Decode up to ``limit`` BGR frames from a video file or an image directory into memory."""
+    frames = []
+    if os.path.isdir(source):
+        paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(source, pattern)))
+        for path in paths[:limit]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+    else:
+        cap = cv2.VideoCapture(source)
+        while len(frames) < limit:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        raise SystemExit(f"No frames could be read from {source}")
+    if resize:
+        frames = [cv2.resize(f, resize, interpolation=cv2.INTER_AREA) for f in frames]
+    return frames
+
+
+def replay_producer(transport, source_id, frames, total, fps, stop_event):
+    """Publish ``total`` frames (cycling through ``frames``) like camera_producer does; returns frames sent."""
+    interval = 1.0 / fps if fps else 0.0
+    next_at = time.monotonic()
+    sent = 0
+    for i in range(total):
+        if stop_event.is_set():
+            break
+        t0 = time.perf_counter()
+        # copy so that consumer-side annotation never leaks into a later replay of the same frame
+        frame = frames[i % len(frames)].copy()
+        observe_stage(source_id, "read", time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        transport.send(frame, time.time())
+        observe_stage(source_id, "publish", time.perf_counter() - t0)
+        FRAMES_TOTAL.inc(source_id, "producer")
+        sent += 1
+        if interval:
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    return sent
+
+
+def wait_for_drain(source_id, sent, idle_timeout):
+    """Block until the consumer has handled or dropped every sent frame, or made no progress for ``idle_timeout``."""
+    last = -1
+    last_change = time.monotonic()
+    while True:
+        done = FRAMES_TOTAL.value(source_id, "consumer") + DROPPED_FRAMES.sum(source_id)
+        if done >= sent:
+            return
+        if done != last:
+            last, last_change = done, time.monotonic()
+        elif time.monotonic() - last_change > idle_timeout:
+            logger.warning(f"Consumer stalled at {done}/{sent} frames, stopping")
+            return
+        time.sleep(0.05)
+
+
+def stage_percentiles(source_id):
+    stages = {}
+    for camera, stage in STAGE_SECONDS.label_sets():
+        if camera != source_id:
+            continue
+        _, total, count = STAGE_SECONDS.snapshot(camera, stage)
+        stats = {"count": count, "mean_ms": total / count * 1000 if count else 0.0}
+        for q in QUANTILES:
+            stats[f"p{int(q * 100)}_ms"] = STAGE_SECONDS.quantile(q, camera, stage) * 1000
+        stages[stage] = stats
+    return stages
+
+
+def run(args):
+    source_id = "bench"
+    frames = load_frames(args.source, args.frames, resize=args.resize)
+    h, w = frames[0].shape[:2]
+    workdir = tempfile.mkdtemp(prefix="steel-bench-")
+    settings.FRAMES_PATH = os.path.join(workdir, "frames")
+    settings.CROPPED_IMAGES_PATH = os.path.join(workdir, "cropped_images")
+    # the consumer must never throttle itself; the producer sets the pace
+    settings.FRAME_RATE = 1_000_000
+
+    counting_line_x = min(settings.DEFAULT_COUNTING_LINE_X, w - 1)
+    source_info = {
+        "transport": args.transport,
+        "width": w,
+        "height": h,
+        "bbox": settings.DEFAULT_BBOX,
+        "counting_line_x": counting_line_x,
+        "barcode_mode": args.barcode_mode,
+    }
+    counter = None
+    if not args.real_models:
+        from ai.barcode import set_ocr
+        set_ocr(StubOCR(latency=args.ocr_ms / 1000.0))
+        counter = StubCounter(counting_line_x, latency=args.yolo_ms / 1000.0, every=args.ingot_every)
+
+    producer_transport = create_transport(source_id, source_info)
+    db_logger = WriteBehindLogger(DatabaseLogger(
+        local_db_path=os.path.join(workdir, "local.db"), main_enabled=False,
+        frame_store_path=os.path.join(workdir, "frame_store")
+    ))
+    stop_event = threading.Event()
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    consumer = threading.Thread(
+        target=frame_consumer, args=(source_id,),
+        kwargs=dict(stop_event=stop_event, source_info=source_info,
+                    counter=counter, db_logger=db_logger),
+        daemon=True, name="bench-consumer"
+    )
+    consumer.start()
+    sent = replay_producer(producer_transport, source_id, frames, args.frames, args.fps, stop_event)
+    wait_for_drain(source_id, sent, args.idle_timeout)
+    processing_seconds = time.perf_counter() - started
+    stop_event.set()
+    # frame_consumer closes the DB writer on exit, which flushes the queued records
+    consumer.join(timeout=60)
+    producer_transport.close()
+    elapsed = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    consumed = FRAMES_TOTAL.value(source_id, "consumer")
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        "label": args.label,
+        "config": {
+            "source": args.source,
+            "transport": args.transport,
+            "frame_size": [w, h],
+            "frames": args.frames,
+            "producer_fps": args.fps,
+            "real_models": args.real_models,
+            "yolo_ms": None if args.real_models else args.yolo_ms,
+            "ocr_ms": None if args.real_models else args.ocr_ms,
+            "barcode_mode": args.barcode_mode,
+        },
+        "host": {"machine": platform.machine(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "frames_sent": sent,
+        "frames_consumed": consumed,
+        "frames_dropped": DROPPED_FRAMES.sum(source_id),
+        "fps": consumed / processing_seconds if processing_seconds else 0.0,
+        "wall_seconds": elapsed,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_frame": cpu / consumed * 1000 if consumed else 0.0,
+        # ru_maxrss is in KiB on Linux and includes the frames preloaded for replay
+        "peak_rss_mb": usage_after.ru_maxrss / 1024.0,
+        "stages": stage_percentiles(source_id),
+    }
+
+
+def flatten(result):
+    flat = {key: result[key] for key in ("fps", "cpu_ms_per_frame", "peak_rss_mb", "frames_dropped")}
+    for stage, stats in result["stages"].items():
+        for q in QUANTILES:
+            key = f"p{int(q * 100)}_ms"
+            flat[f"{stage}.{key}"] = stats[key]
+    return flat
+
+
+def print_report(result, baseline=None):
+    print(f"\n{result['label']}: {result['frames_consumed']}/{result['frames_sent']} frames, "
+          f"{result['frames_dropped']} dropped, {result['fps']:.1f} fps, "
+          f"{result['cpu_ms_per_frame']:.1f} CPU ms/frame, peak RSS {result['peak_rss_mb']:.0f} MB")
+    current = flatten(result)
+    previous = flatten(baseline) if baseline else {}
+    header = f"{'metric':<28}{'current':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'change':>10}"
+    print(header)
+    for key, value in current.items():
+        line = f"{key:<28}{value:>12.2f}"
+        if baseline:
+            old = previous.get(key)
+            if old is None:
+                line += f"{'-':>12}{'':>10}"
+            else:
+                change = f"{(value - old) / old * 100:+.1f}%" if old else "-"
+                line += f"{old:>12.2f}{change:>10}"
+        print(line)
+
+
+def load_baselines(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="video file or directory of frame images")
+    parser.add_argument("--label", default="default", help="name of this configuration in the baseline file")
+    parser.add_argument("--frames", type=int, default=300, help="frames to replay (the source is cycled if shorter)")
+    parser.add_argument("--fps", type=float, default=0, help="producer rate; 0 publishes as fast as possible")
+    parser.add_argument("--transport", default="memory", choices=("memory", "shm"))
+    parser.add_argument("--resize", type=int, nargs=2, metavar=("W", "H"), help="resize frames before replay")
+    parser.add_argument("--barcode-mode", default=settings.BARCODE_MODE, choices=("track", "frame"))
+    parser.add_argument("--real-models", action="store_true", help="use the YOLO weights and PaddleOCR instead of stubs")
+    parser.add_argument("--yolo-ms", type=float, default=30.0, help="stub YOLO latency per frame")
+    parser.add_argument("--ocr-ms", type=float, default=50.0, help="stub OCR latency per call")
+    parser.add_argument("--ingot-every", type=int, default=25, help="stub counter reports an ingot every N frames")
+    parser.add_argument("--idle-timeout", type=float, default=5.0, help="give up draining after this many idle seconds")
+    parser.add_argument("--save", metavar="FILE", help="store this run under its label in a JSON baseline file")
+    parser.add_argument("--compare", metavar="FILE", help="compare against the same label in a JSON baseline file")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # frame_consumer raises the root logger to INFO on import
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    result = run(args)
+    baseline = load_baselines(args.compare).get(args.label) if args.compare else None
+    if args.compare and baseline is None:
+        print(f"No baseline for '{args.label}' in {args.compare}")
+    print_report(result, baseline)
+    if args.save:
+        baselines = load_baselines(args.save)
+        baselines[args.label] = result
+        with open(args.save, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved '{args.label}' to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import bisect
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+import cv2
+import numpy as np
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# the stream is cut into access units at the AUD NAL that h264_metadata/hevc_metadata insert before each one
+CODECS = {
+    "h264": {"format": "h264", "bsf": "dump_extra,h264_metadata=aud=insert", "aud": b"\x00\x00\x00\x01\x09"},
+    "hevc": {"format": "hevc", "bsf": "dump_extra,hevc_metadata=aud=insert", "aud": b"\x00\x00\x00\x01\x46\x01"},
+}
+
+
+def is_keyframe(codec, access_unit):
+    """True when the access unit holds an IDR (h264) or IRAP (hevc) slice, i.e. decoding can start there."""
+    pos = access_unit.find(b"\x00\x00\x01")
+    while pos != -1 and pos + 3 < len(access_unit):
+        header = access_unit[pos + 3]
+        if codec == "h264" and header & 0x1f == 5:
+            return True
+        if codec == "hevc" and 16 <= (header >> 1) & 0x3f <= 21:
+            return True
+        pos = access_unit.find(b"\x00\x00\x01", pos + 3)
+    return False
+
+
+class AccessUnitSplitter:
+    """Cuts an Annex B byte stream into access units, stamping each with the time its first bytes arrived."""
+
+    def __init__(self, marker):
+        self.marker = marker
+        self._buf = bytearray()
+        self._started_at = None
+
+    def feed(self, chunk, now):
+        """Add bytes read from the pipe; return the (access unit, timestamp) pairs completed by them."""
+        search_from = max(1, len(self._buf) - len(self.marker) + 1)
+        self._buf += chunk
+        if self._started_at is None:
+            start = self._buf.find(self.marker)
+            if start == -1:
+                # keep only a possible partial marker while looking for the first one
+                del self._buf[:max(0, len(self._buf) - len(self.marker) + 1)]
+                return []
+            del self._buf[:start]
+            self._started_at = now
+            search_from = 1
+        units = []
+        pos = self._buf.find(self.marker, search_from)
+        while pos != -1:
+            units.append((bytes(self._buf[:pos]), self._started_at))
+            del self._buf[:pos]
+            self._started_at = now
+            pos = self._buf.find(self.marker, 1)
+        return units
+
+
+class EvidenceClip:
+    """The compressed access units from a keyframe up to the one nearest an event; decoded only on demand."""
+
+    def __init__(self, codec, access_units, width, height):
+        self.codec = codec
+        self.access_units = access_units
+        self.width = width
+        self.height = height
+
+    def decode(self, timeout=None):
+        """Decode up to the event's access unit and return that frame, or None if ffmpeg fails."""
+        ffmpeg_cmd = [
+            'ffmpeg', '-loglevel', 'error',
+            '-f', CODECS[self.codec]["format"], '-i', 'pipe:0',
+            '-vf', f"select=eq(n\\,{len(self.access_units) - 1})", '-vsync', '0', '-frames:v', '1',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'
+        ]
+        try:
+            result = subprocess.run(
+                ffmpeg_cmd, input=b"".join(self.access_units), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                timeout=timeout or settings.EVIDENCE_DECODE_TIMEOUT
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"❌ Evidence decode failed: {e}")
+            return None
+        size = self.width * self.height * 3
+        if len(result.stdout) < size:
+            logger.error(f"❌ Evidence decode returned no frame: {result.stderr.decode(errors='replace').strip()}")
+            return None
+        return np.frombuffer(result.stdout, np.uint8, count=size).reshape((self.height, self.width, 3)).copy()
+
+
+def feed_to_full(frame, offset, scale, width, height):
+    """Place an upscaled feed frame on a full-resolution canvas, so full-resolution coordinates still apply."""
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    x, y = offset
+    w = min(width - x, int(round(frame.shape[1] / scale)))
+    h = min(height - y, int(round(frame.shape[0] / scale)))
+    canvas[y:y + h, x:x + w] = cv2.resize(frame, (w, h), interpolation=cv2.INTER_LINEAR)
+    return canvas
+
+
+def decode_or_upscale(clip, packet):
+    """The clip's full-resolution frame, or the packet's feed frame upscaled when the clip cannot be decoded."""
+    frame = clip.decode()
+    if frame is None:
+        frame = feed_to_full(packet.frame, packet.offset, packet.scale, clip.width, clip.height)
+    return frame
+
+
+class EvidenceBuffer:
+    """Keeps the last EVIDENCE_BUFFER_SECONDS of a camera's main stream, still compressed, grouped by GOP."""
+
+    def __init__(self, codec, width, height, max_seconds=None):
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.max_seconds = max_seconds or settings.EVIDENCE_BUFFER_SECONDS
+        # each GOP: ([timestamps], [access units]), starting at a keyframe
+        self._gops = deque()
+        self.buffered_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, access_unit, timestamp, keyframe):
+        with self._lock:
+            if keyframe:
+                self._gops.append(([], []))
+            elif not self._gops:
+                # nothing to decode it from
+                return
+            timestamps, units = self._gops[-1]
+            timestamps.append(timestamp)
+            units.append(access_unit)
+            self.buffered_bytes += len(access_unit)
+            while len(self._gops) > 1 and self._gops[0][0][-1] < timestamp - self.max_seconds:
+                self.buffered_bytes -= sum(len(unit) for unit in self._gops.popleft()[1])
+
+    def clip(self, timestamp, max_skew=None):
+        """The EvidenceClip for the access unit captured nearest to ``timestamp``, or None.
+
+        Only slices the buffer; decoding happens when the clip's ``decode``
+        is called, normally on an image sink thread.
+        """
+        max_skew = settings.EVIDENCE_MAX_SKEW if max_skew is None else max_skew
+        with self._lock:
+            best = None
+            for gop_index, (timestamps, _) in enumerate(self._gops):
+                i = bisect.bisect_left(timestamps, timestamp)
+                for j in (i - 1, i):
+                    if 0 <= j < len(timestamps):
+                        skew = abs(timestamps[j] - timestamp)
+                        if best is None or skew < best[0]:
+                            best = (skew, gop_index, j)
+            if best is None or best[0] > max_skew:
+                return None
+            _, gop_index, j = best
+            return EvidenceClip(self.codec, self._gops[gop_index][1][:j + 1], self.width, self.height)
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_evidence_buffer(camera_id, width=None, height=None, codec=None):
+    """Return the camera's evidence buffer; it is created when width and height are given."""
+    with _buffers_lock:
+        buffer = _buffers.get(camera_id)
+        if buffer is None and width and height:
+            buffer = EvidenceBuffer(codec or settings.EVIDENCE_CODEC, width, height)
+            _buffers[camera_id] = buffer
+        return buffer
+
+
+def evidence_producer(camera_id, rtsp_url, width, height, stop_event=None, codec=None):
+    """Copy the main stream, undecoded, into the camera's evidence buffer.
+
+    ffmpeg only demuxes (``-c:v copy``); frames are decoded one at a time
+    when an event asks for them, so the main stream costs no decode CPU
+    between events.
+    """
+    codec = codec or settings.EVIDENCE_CODEC
+    spec = CODECS[codec]
+    buffer = get_evidence_buffer(camera_id, width, height, codec)
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-rtsp_transport', 'tcp',
+        '-i', rtsp_url,
+        '-map', '0:v:0',
+        '-an',
+        '-c:v', 'copy',
+        '-bsf:v', spec["bsf"],
+        '-f', spec["format"],
+        '-'
+    ]
+    logger.info(f"Starting evidence producer for {camera_id} at {width}x{height} ({codec}, compressed)")
+    while stop_event is None or not stop_event.is_set():
+        process = None
+        try:
+            process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+            splitter = AccessUnitSplitter(spec["aud"])
+            while process.poll() is None and (stop_event is None or not stop_event.is_set()):
+                chunk = process.stdout.read(1 << 16)
+                if not chunk:
+                    break
+                for access_unit, timestamp in splitter.feed(chunk, time.time()):
+                    buffer.put(access_unit, timestamp, is_keyframe(codec, access_unit))
+        except Exception as e:
+            logger.error(f"Error in evidence producer for {camera_id}: {e}")
+            time.sleep(5)
+        finally:
+            if process is not None:
+                process.terminate()
+    logger.info(f"Stopping evidence producer for {camera_id}")
@@ -0,0 +1,77 @@
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RawFrameReader:
+    """Reads fixed-size raw frames from a pipe into a ring of preallocated buffers.
+
+    Frames are filled in place with ``readinto`` and returned as numpy views over
+    the ring slot, so no intermediate ``bytes``/``bytearray`` copies are made.
+    A returned frame stays valid until ``ring_size`` further frames are read.
+    """
+
+    def __init__(self, stream, width, height, channels=3, ring_size=4):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.frame_size = width * height * channels
+        self.ring_size = ring_size
+        self._ring = [np.empty((height, width, channels), dtype=np.uint8) for _ in range(ring_size)]
+        self._views = [memoryview(buf.reshape(-1)) for buf in self._ring]
+        self._index = 0
+        self._has_readinto = hasattr(stream, "readinto")
+
+        self.frames_read = 0
+        self.last_stall = 0.0
+        self.last_bytes_copied = 0
+        self.total_stall = 0.0
+        self.total_bytes_copied = 0
+
+    def _fill(self, view):
+        """Fill ``view`` completely; return the number of bytes copied in user space, or None on EOF."""
+        filled = 0
+        copied = 0
+        while filled < self.frame_size:
+            if self._has_readinto:
+                n = self.stream.readinto(view[filled:])
+            else:
+                data = self.stream.read(self.frame_size - filled)
+                n = len(data) if data else 0
+                if n:
+                    view[filled:filled + n] = data
+                    copied += n
+            if not n:
+                if filled:
+                    logger.warning(f"Stream ended with a partial frame ({filled}/{self.frame_size} bytes)")
+                return None
+            filled += n
+        return copied
+
+    def read(self):
+        """Return the next frame as an (H, W, C) uint8 view, or None at end of stream."""
+        t0 = time.perf_counter()
+        copied = self._fill(self._views[self._index])
+        if copied is None:
+            return None
+        frame = self._ring[self._index]
+        self._index = (self._index + 1) % self.ring_size
+
+        self.last_stall = time.perf_counter() - t0
+        self.last_bytes_copied = copied
+        self.total_stall += self.last_stall
+        self.total_bytes_copied += copied
+        self.frames_read += 1
+        return frame
+
+    def stats(self):
+        return {
+            "frames_read": self.frames_read,
+            "last_stall": self.last_stall,
+            "last_bytes_copied": self.last_bytes_copied,
+            "avg_stall": self.total_stall / self.frames_read if self.frames_read else 0.0,
+            "total_bytes_copied": self.total_bytes_copied,
+        }
@@ -1,10 +1,14 @@
 import subprocess
-import pickle
 import logging
-import numpy as np
 import cv2
 import time
-from rabbitmq.client import RabbitMQClient
+from threading import Thread
+from capture.frame_reader import RawFrameReader
+from capture.roi import capture_geometry
+from capture.evidence import evidence_producer
+from transport.backpressure import RateController, backpressure_policy
+from transport.factory import create_transport
+from monitoring.metrics import COMPONENT_GAUGE, DROPPED_FRAMES, FRAMES_TOTAL, observe_stage
 from config.config import settings
 
 logger = logging.getLogger(__name__)
@@ -15,73 +19,109 @@ def camera_producer(camera_id, stop_event=None):
         logger.error(f"Camera {camera_id} not found in configuration")
         return
     rtsp_url = camera_info["rtsp"]
-    logger.info(f"Starting camera producer for {camera_id} with URL: {rtsp_url}")
+    geometry = capture_geometry(camera_info)
+    frame_width, frame_height = geometry["width"], geometry["height"]
+    offset, scale = geometry["offset"], geometry["scale"]
+    logger.info(
+        f"Starting camera producer for {camera_id} with URL: {geometry['input']} "
+        f"({frame_width}x{frame_height}, offset {offset}, scale {scale:.3f})"
+    )
+    filters = ['-vf', ','.join(geometry["filters"])] if geometry["filters"] else []
+    if geometry["dual_stream"]:
+        Thread(
+            target=evidence_producer,
+            args=(
+                camera_id, rtsp_url,
+                camera_info.get("width", settings.DEFAULT_FRAME_WIDTH),
+                camera_info.get("height", settings.DEFAULT_FRAME_HEIGHT),
+                stop_event,
+                camera_info["dual_stream"].get("codec")
+            ),
+            daemon=True
+        ).start()
     ffmpeg_cmd = [
         'ffmpeg',
         '-rtsp_transport', 'tcp',
         "-skip_frame", "nokey",
-        '-i', rtsp_url,
+        '-i', geometry["input"],
         '-r', str(settings.FRAME_RATE),
         "-vsync", "0",
+        *filters,
         # '-buffer_size', '1024000',
         '-f', 'image2pipe',
         '-pix_fmt', 'bgr24',
         '-vcodec', 'rawvideo',
         '-'
     ]
-    frame_width = 3840
-    frame_height = 2160
-    frame_size = frame_width * frame_height * 3
     interval = 1.0 / settings.FRAME_RATE
+    policy = backpressure_policy(camera_info)
     while stop_event is None or not stop_event.is_set():
+        process = transport = None
         try:
             # process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            rabbitmq_client = RabbitMQClient(
-                settings.RABBITMQ_HOST, settings.RABBITMQ_PORT,
-                settings.RABBITMQ_USER, settings.RABBITMQ_PASS
-            )
-            rabbitmq_client.connect()
-            buffer = bytearray()
+            # bufsize=0 gives an unbuffered pipe so readinto lands straight in the frame ring
+            process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+            transport = create_transport(camera_id, camera_info)
+            reader = RawFrameReader(process.stdout, frame_width, frame_height)
+            rate = RateController(settings.FRAME_RATE, policy)
+            last_published = 0.0
+            last_reading_at = None
+            published_since_update = True
             while process.poll() is None and (stop_event is None or not stop_event.is_set()):
-                data = process.stdout.read(frame_size)
-                if not data:
+                frame = reader.read()
+                if frame is None:
                     break
-                
-                buffer.extend(data)
-                while len(buffer) >= frame_size:
-                    raw_frame = buffer[:frame_size]
-                    buffer = buffer[frame_size:]
-                    frame = np.frombuffer(raw_frame, dtype=np.uint8).reshape((frame_height, frame_width, 3))
-                    _, buffer_img = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    compressed_frame = buffer_img.tobytes()
-                    timestamp = time.time()
-                    frame_data = {'frame': compressed_frame, 'timestamp': timestamp}
-                    t0=time.time()
-                    rabbitmq_client.publish(f"frame_queue_{camera_id}", pickle.dumps(frame_data))
-                    dt=time.time()-t0
-                    logger.info(f"{camera_id} publish {dt:.4f}s")
-                    sleep = interval-dt
-                    if sleep > 0:
-                        time.sleep(sleep)
-            process.terminate()
-            rabbitmq_client.close()
+                timestamp = time.time()
+                # keep draining ffmpeg at full rate, but publish only as often as the consumer keeps up;
+                # half a frame of slack so jitter does not skip frames at the base rate
+                backlog, reading_at = transport.backlog_reading()
+                # one controller step per new backlog reading with a publish in between; a cached reading,
+                # or one taken while throttled frames were skipped, is not new evidence
+                if reading_at != last_reading_at and published_since_update:
+                    rate.update(backlog)
+                    last_reading_at = reading_at
+                    published_since_update = False
+                publish_interval = rate.interval
+                COMPONENT_GAUGE.set(rate.fps, "producer", camera_id, "publish_fps")
+                if backlog is not None:
+                    COMPONENT_GAUGE.set(backlog, "producer", camera_id, "backlog")
+                if timestamp - last_published < publish_interval - interval / 2:
+                    DROPPED_FRAMES.inc(camera_id, "throttled")
+                    continue
+                last_published = timestamp
+                published_since_update = True
+                t0=time.time()
+                transport.send(frame, timestamp, offset, scale)
+                dt=time.time()-t0
+                observe_stage(camera_id, "read", reader.last_stall)
+                observe_stage(camera_id, "publish", dt)
+                FRAMES_TOTAL.inc(camera_id, "producer")
+                logger.debug(
+                    f"{camera_id} read stall {reader.last_stall:.4f}s "
+                    f"copied {reader.last_bytes_copied}B {transport.name} send {dt:.4f}s"
+                )
+                sleep = interval-dt
+                if sleep > 0:
+                    time.sleep(sleep)
         except Exception as e:
             logger.error(f"Error in camera producer for {camera_id}: {e}")
             time.sleep(5)
+        finally:
+            # every reconnect opens a new ffmpeg and transport; never leave the old ones behind
+            if process is not None:
+                process.terminate()
+            if transport is not None:
+                transport.close()
     logger.info(f"Stopping camera producer for {camera_id}")
 
 
 
 
 ### video only
-def video_producer(video_path, processor_id, stop_event=None):
+def video_producer(video_path, processor_id, stop_event=None, source_info=None):
     cap = cv2.VideoCapture(video_path)
-    rabbitmq_client = RabbitMQClient(
-        settings.RABBITMQ_HOST, settings.RABBITMQ_PORT,
-        settings.RABBITMQ_USER, settings.RABBITMQ_PASS
-    )
-    rabbitmq_client.connect()
+    source_info = source_info or settings.VIDEOS.get(processor_id)
+    transport = create_transport(processor_id, source_info)
     frame_count = 0
     try:
         while cap.isOpened() and (stop_event is None or not stop_event.is_set()):
@@ -89,19 +129,15 @@ def video_producer(video_path, processor_id, stop_event=None):
             if not ret:
                 break
             try:
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                compressed_frame = buffer.tobytes()
-                timestamp = time.time()
-                frame_data = {'frame': compressed_frame, 'timestamp': timestamp}
-                rabbitmq_client.publish(f"frame_queue_{processor_id}", pickle.dumps(frame_data))
+                transport.send(frame, time.time())
                 frame_count += 1
-                logger.info(f"Video {processor_id} - Frame {frame_count} sent to RabbitMQ")
+                logger.info(f"Video {processor_id} - Frame {frame_count} sent via {transport.name}")
                 time.sleep(0.5)
             except Exception as e:
                 logger.error(f"Error in video producer for {processor_id}: {e}")
     finally:
         cap.release()
-        rabbitmq_client.close()
+        transport.close()
         if stop_event:
             stop_event.set()
             logger.info(f"Video {processor_id} - Stop event set, signaling consumer to exit")
@@ -0,0 +1,99 @@
+from config.config import settings
+
+
+def compute_roi(camera_info, frame_width, frame_height):
+    """Return the capture region (x, y, w, h) for a camera, or None when ROI mode is off.
+
+    The region is the union of the barcode ``bbox`` and a band of
+    ``band_half_width`` pixels either side of ``counting_line_x``, grown by
+    ``margin`` and clipped to the frame. The band spans the bbox rows unless
+    ``band_y_min``/``band_y_max`` are given. Edges are rounded to even pixels
+    so ffmpeg's crop filter does not have to realign chroma.
+    """
+    roi_cfg = camera_info.get("roi", {})
+    if not roi_cfg.get("enabled", settings.ROI_ENABLED):
+        return None
+    margin = roi_cfg.get("margin", settings.ROI_MARGIN)
+    half_band = roi_cfg.get("band_half_width", settings.ROI_BAND_HALF_WIDTH)
+    bbox = camera_info.get("bbox", settings.DEFAULT_BBOX)
+    line_x = camera_info.get("counting_line_x", settings.DEFAULT_COUNTING_LINE_X)
+
+    x_min = min(bbox["x_min"], line_x - half_band)
+    x_max = max(bbox["x_max"], line_x + half_band)
+    y_min = min(bbox["y_min"], roi_cfg.get("band_y_min", bbox["y_min"]))
+    y_max = max(bbox["y_max"], roi_cfg.get("band_y_max", bbox["y_max"]))
+
+    x_min = max(0, x_min - margin) // 2 * 2
+    y_min = max(0, y_min - margin) // 2 * 2
+    x_max = min(frame_width, x_max + margin) // 2 * 2
+    y_max = min(frame_height, y_max + margin) // 2 * 2
+    return x_min, y_min, x_max - x_min, y_max - y_min
+
+
+def _even(value):
+    return int(round(value)) // 2 * 2
+
+
+def capture_geometry(camera_info):
+    """Work out what the inference feed of a camera looks like.
+
+    Returns a dict with the ffmpeg ``input`` URL, the video ``filters`` to
+    apply, the output ``width``/``height``, and how output pixels map back to
+    full-resolution camera coordinates: ``full = local / scale + offset``.
+
+    With ``dual_stream`` enabled the feed is either the camera's substream
+    (``substream_rtsp`` plus its ``width``/``height``) or the main stream
+    downscaled by ``scale``. The ROI is always computed on the main stream and
+    carried over into the feed's coordinates.
+    """
+    full_w = camera_info.get("width", settings.DEFAULT_FRAME_WIDTH)
+    full_h = camera_info.get("height", settings.DEFAULT_FRAME_HEIGHT)
+    dual = camera_info.get("dual_stream", {})
+    dual_enabled = dual.get("enabled", False)
+    roi = compute_roi(camera_info, full_w, full_h)
+    x, y, w, h = roi or (0, 0, full_w, full_h)
+    filters = []
+    input_url = camera_info["rtsp"]
+    scale = 1.0
+    if dual_enabled and dual.get("substream_rtsp"):
+        input_url = dual["substream_rtsp"]
+        scale = dual["width"] / full_w
+        if roi:
+            filters.append(f"crop={_even(w * scale)}:{_even(h * scale)}:{_even(x * scale)}:{_even(y * scale)}")
+        out_w, out_h = (_even(w * scale), _even(h * scale)) if roi else (dual["width"], dual["height"])
+    else:
+        if roi:
+            filters.append(f"crop={w}:{h}:{x}:{y}")
+        out_w, out_h = w, h
+        if dual_enabled:
+            scale = dual.get("scale", settings.DUAL_STREAM_SCALE)
+            out_w, out_h = _even(w * scale), _even(h * scale)
+            filters.append(f"scale={out_w}:{out_h}")
+    return {
+        "input": input_url,
+        "filters": filters,
+        "width": out_w,
+        "height": out_h,
+        "offset": (x, y),
+        "scale": scale,
+        "dual_stream": dual_enabled,
+    }
+
+
+def to_local_bbox(bbox, offset, scale=1.0):
+    """Map a full-frame bbox into a feed that starts at ``offset`` and is scaled by ``scale``."""
+    ox, oy = offset
+    return {
+        "x_min": int((bbox["x_min"] - ox) * scale),
+        "y_min": int((bbox["y_min"] - oy) * scale),
+        "x_max": int((bbox["x_max"] - ox) * scale),
+        "y_max": int((bbox["y_max"] - oy) * scale),
+    }
+
+
+def tracks_to_full(tracks, offset, scale=1.0):
+    """Map the box columns of a track array from feed coordinates back to full resolution."""
+    full = tracks.copy()
+    full[:, [0, 2]] = full[:, [0, 2]] / scale + offset[0]
+    full[:, [1, 3]] = full[:, [1, 3]] / scale + offset[1]
+    return full
@@ -1,16 +1,54 @@
-import sqlite3
 import pyodbc
 import datetime
 import logging
 import threading
 import time
+from db.frame_store import FrameStore, get_frame_store
+from db.local_store import open_local_db, ensure_schema_tuning, ensure_frame_columns, apply_retention, local_store_stats
 from config.config import settings
 
 logger = logging.getLogger(__name__)
 
+SYNC_MIN_BATCH = 50
+SYNC_MAX_BATCH = 5000
+
+# how each local table maps onto the main database during sync; rows are read with local_columns.
+# frame_columns are the positions of the frame store ref, the legacy frame BLOB and the memo; params
+# takes the row plus the frame bytes and memo resolved for it
+SYNC_TABLES = {
+    "barcodes": {
+        "local_columns": "id, camera_id, barcode, frame_datetime, frame_ref, frame_data, memo",
+        "main_table": "AiBarcodeInFrame",
+        "key_columns": ("cameraId", "barcode", "frameDateTime"),
+        "key": lambda r: (r[1], r[2], datetime.datetime.fromisoformat(r[3])),
+        "frame_columns": (4, 5, 6),
+        "insert": "EXEC aiStpInsertFrameBarcode @cameraId=?, @barcode=?, @frameDateTime=?, @frame=?, @memo=?",
+        "params": lambda r, frame, memo: (r[1], r[2], datetime.datetime.fromisoformat(r[3]), frame, memo),
+    },
+    "ingots": {
+        "local_columns": "id, camera_id, height, width, frame_datetime, frame_ref, frame_data, memo",
+        "main_table": "AiIngotInFrame",
+        "key_columns": ("cameraId", "height", "width", "frameDateTime"),
+        "key": lambda r: (r[1], r[2], r[3], datetime.datetime.fromisoformat(r[4])),
+        "frame_columns": (5, 6, 7),
+        "insert": "EXEC aiStpInsertFrameIngot @cameraId=?, @width=?, @height=?, @frameDateTime=?, @frame=?, @memo=?",
+        "params": lambda r, frame, memo: (r[1], r[3], r[2], datetime.datetime.fromisoformat(r[4]), frame, memo),
+    },
+}
+
+
+def frame_memo(memo, digest):
+    """Memo pointing a main-database row at its frame in FRAME_STORE_MAIN_TABLE."""
+    return f"{memo}; frame={digest}" if memo else f"frame={digest}"
+
 class DatabaseLogger:
-    def __init__(self):
-        """Initialize connections to main and local databases."""
+    def __init__(self, local_db_path=None, main_enabled=True, frame_store_path=None):
+        """Initialize connections to main and local databases.
+
+        With ``main_enabled=False`` only the local SQLite database is used (benchmarks, offline runs).
+        Frames go to the content-addressed store at ``frame_store_path`` (FRAME_STORE_PATH by default).
+        """
+        self.main_enabled = main_enabled
         self.main_conn_str = (
             f'DRIVER={{ODBC Driver 17 for SQL Server}};'
             f'SERVER={settings.DB_SERVER};'
@@ -18,13 +56,25 @@ class DatabaseLogger:
             f'UID={settings.USERNAME};'
             f'PWD={settings.PASSWORD}'
         )
-        self.local_db_path = "/app/output/local.db"
-        self.local_conn = sqlite3.connect(self.local_db_path, check_same_thread=False)
+        self.local_db_path = local_db_path or settings.LOCAL_DB_PATH
+        self.local_conn = open_local_db(self.local_db_path)
         self.local_cursor = self.local_conn.cursor()
+        # connections are shared by the writer and sync threads
+        self.local_lock = threading.RLock()
+        self.main_lock = threading.RLock()
+        self.frame_store = get_frame_store(frame_store_path)
+        self.frames_uploaded = 0
         self._create_local_tables()
+        ensure_frame_columns(self.local_conn)
+        ensure_schema_tuning(self.local_conn, self.local_db_path)
+        self._closed = threading.Event()
+        self._last_maintenance = 0.0
         self.main_conn = None
         self.main_cursor = None
-        self._connect_to_main_db()
+        self.sync_batch_size = settings.SYNC_INITIAL_BATCH_SIZE
+        self.sync_stats = {}
+        if self.main_enabled:
+            self._connect_to_main_db()
         self.sync_thread = threading.Thread(target=self._sync_periodically, daemon=True)
         self.sync_thread.start()
         logger.info("🔄 Synchronization thread started.")
@@ -38,6 +88,8 @@ class DatabaseLogger:
                 barcode TEXT,
                 frame_datetime TEXT,
                 frame_data BLOB,
+                frame_ref TEXT,
+                thumbnail BLOB,
                 memo TEXT,
                 synced INTEGER DEFAULT 0
             )
@@ -50,10 +102,14 @@ class DatabaseLogger:
                 width REAL,
                 frame_datetime TEXT,
                 frame_data BLOB,
+                frame_ref TEXT,
+                thumbnail BLOB,
                 memo TEXT,
                 synced INTEGER DEFAULT 0
             )
         """)
+        # frame store refs already sent to FRAME_STORE_MAIN_TABLE
+        self.local_cursor.execute("CREATE TABLE IF NOT EXISTS frame_uploads (ref TEXT PRIMARY KEY)")
         self.local_conn.commit()
 
     def _connect_to_main_db(self):
@@ -68,112 +124,279 @@ class DatabaseLogger:
             self.main_conn = None
             self.main_cursor = None
 
-    def log_barcode(self, camera_id, barcode, frame_datetime, frame_data, memo):
+    def log_barcode(self, camera_id, barcode, frame_datetime, frame_data, memo, thumbnail=None):
         """Log barcode data to the local database and attempt to log to the main database."""
-        self.local_cursor.execute(
-            "INSERT INTO barcodes (camera_id, barcode, frame_datetime, frame_data, memo, synced) VALUES (?, ?, ?, ?, ?, 0)",
-            (camera_id, barcode, frame_datetime.isoformat(), frame_data, memo)
-        )
-        self.local_conn.commit()
-        logger.info(f"📝 Barcode {barcode} for camera {camera_id} saved to local database with synced=0")
-        if self.main_conn:
+        self.write_batch([("barcodes", (camera_id, barcode, frame_datetime, frame_data, memo, thumbnail))])
+
+    def log_ingot(self, camera_id, height, width, frame_datetime, frame_data, memo, thumbnail=None):
+        """Log ingot data to the local database and attempt to log to the main database."""
+        self.write_batch([("ingots", (camera_id, height, width, frame_datetime, frame_data, memo, thumbnail))])
+
+    def write_batch(self, records, push_to_main=True):
+        """Insert (table, values) records into the local database in one transaction, then push them to the main database.
+
+        Frames are written to the frame store first; rows only hold its ref and the ROI thumbnail.
+        """
+        frames = [self._store_frame(values[-3], values[-4]) for _, values in records]
+        inserted = {"barcodes": [], "ingots": []}
+        with self.local_lock:
             try:
-                self.main_cursor.execute(
-                    "EXEC aiStpInsertFrameBarcode @cameraId=?, @barcode=?, @frameDateTime=?, @frame=?, @memo=?",
-                    (camera_id, barcode, frame_datetime, frame_data, memo)
-                )
-                self.main_conn.commit()
-                self.local_cursor.execute("UPDATE barcodes SET synced = 1 WHERE id = ?", (self.local_cursor.lastrowid,))
+                for (table, values), (frame_ref, frame_data) in zip(records, frames):
+                    if table == "barcodes":
+                        camera_id, barcode, frame_datetime, _, memo, thumbnail = values
+                        row = (camera_id, barcode, frame_datetime.isoformat(), frame_ref, frame_data, memo)
+                        self.local_cursor.execute(
+                            "INSERT INTO barcodes (camera_id, barcode, frame_datetime, frame_ref, frame_data, thumbnail, memo, synced) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                            row[:5] + (thumbnail, memo)
+                        )
+                    else:
+                        camera_id, height, width, frame_datetime, _, memo, thumbnail = values
+                        row = (camera_id, height, width, frame_datetime.isoformat(), frame_ref, frame_data, memo)
+                        self.local_cursor.execute(
+                            "INSERT INTO ingots (camera_id, height, width, frame_datetime, frame_ref, frame_data, thumbnail, memo, synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                            row[:6] + (thumbnail, memo)
+                        )
+                    # shaped like a row read back with SYNC_TABLES[table]["local_columns"]
+                    inserted[table].append((self.local_cursor.lastrowid,) + row)
                 self.local_conn.commit()
-                logger.info(f"✅ Barcode {barcode} synced to main database")
-            except Exception as e:
-                logger.error(f"❌ Error logging barcode {barcode} to main database: {e}")
-                self._connect_to_main_db()
+            except Exception:
+                self.local_conn.rollback()
+                raise
+        logger.info(f"📝 {len(inserted['barcodes'])} barcodes and {len(inserted['ingots'])} ingots saved to local database with synced=0")
+        if push_to_main and self.main_conn:
+            for table, rows in inserted.items():
+                if rows:
+                    self._push_to_main(table, rows)
 
-    def log_ingot(self, camera_id, height, width, frame_datetime, frame_data, memo):
-        """Log ingot data to the local database and attempt to log to the main database."""
-        self.local_cursor.execute(
-            "INSERT INTO ingots (camera_id, height, width, frame_datetime, frame_data, memo, synced) VALUES (?, ?, ?, ?, ?, ?, 0)",
-            (camera_id, height, width, frame_datetime.isoformat(), frame_data, memo)
-        )
-        self.local_conn.commit()
-        logger.info(f"📝 Ingot for camera {camera_id} saved to local database with synced=0")
-        if self.main_conn:
+    def _store_frame(self, frame_data, frame_datetime):
+        """(frame store ref, None), or (None, bytes) to keep the frame in the row if the store cannot take it."""
+        if not frame_data:
+            return None, None
+        try:
+            return self.frame_store.put(frame_data, frame_datetime), None
+        except OSError as e:
+            logger.error(f"❌ Frame store write failed, keeping the frame in the row: {e}")
+            return None, frame_data
+
+    def _push_to_main(self, table, rows):
+        """Send freshly inserted rows to the main database and mark them synced."""
+        with self.main_lock:
             try:
-                self.main_cursor.execute(
-                    "EXEC aiStpInsertFrameIngot @cameraId=?, @width=?, @height=?, @frameDateTime=?, @frame=?, @memo=?",
-                    (camera_id, width, height, frame_datetime, frame_data, memo)
-                )
+                self._insert_main(table, rows)
                 self.main_conn.commit()
-                self.local_cursor.execute("UPDATE ingots SET synced = 1 WHERE id = ?", (self.local_cursor.lastrowid,))
-                self.local_conn.commit()
-                logger.info(f"✅ Ingot synced to main database")
+                ids = [row[0] for row in rows]
+                with self.local_lock:
+                    self.local_cursor.execute(f"UPDATE {table} SET synced = 1 WHERE id IN ({','.join('?'*len(ids))})", ids)
+                    self.local_conn.commit()
+                logger.info(f"✅ {len(rows)} {table} synced to main database")
             except Exception as e:
-                logger.error(f"❌ Error logging ingot to main database: {e}")
+                logger.error(f"❌ Error logging {table} to main database: {e}")
                 self._connect_to_main_db()
 
     def synchronize(self):
-        """Synchronize unsynced data from local to main database in batches."""
+        """Synchronize unsynced data from local to main database in adaptive bulk batches."""
+        if not self.main_enabled:
+            return
         if not self.main_conn:
             self._connect_to_main_db()
             if not self.main_conn:
                 logger.warning("⚠️ Main database unavailable, skipping sync")
                 return
 
-        batch_size = 100
-        for table in ['barcodes', 'ingots']:
-            self.local_cursor.execute(f"SELECT * FROM {table} WHERE synced = 0 ORDER BY id ASC LIMIT {batch_size}")
-            records = self.local_cursor.fetchall()
+        for table in SYNC_TABLES:
+            started = time.monotonic()
+            synced = 0
+            records = self._fetch_unsynced(table, self.sync_batch_size)
             while records:
-                logger.info(f"📋 Found {len(records)} unsynced records in {table}")
+                t0 = time.monotonic()
                 try:
-                    for record in records:
-                        if table == 'barcodes':
-                            self.main_cursor.execute(
-                                "SELECT COUNT(*) FROM AiBarcodeInFrame WHERE cameraId = ? AND barcode = ? AND frameDateTime = ?",
-                                (record[1], record[2], datetime.datetime.fromisoformat(record[3]))
-                            )
-                            exists = self.main_cursor.fetchone()[0] > 0
-                            if not exists:
-                                self.main_cursor.execute(
-                                    "EXEC aiStpInsertFrameBarcode @cameraId=?, @barcode=?, @frameDateTime=?, @frame=?, @memo=?",
-                                    (record[1], record[2], datetime.datetime.fromisoformat(record[3]), record[4], record[5])
-                                )
-                        elif table == 'ingots':
-                            self.main_cursor.execute(
-                                "SELECT COUNT(*) FROM AiIngotInFrame WHERE cameraId = ? AND height = ? AND width = ? AND frameDateTime = ?",
-                                (record[1], record[2], record[3], datetime.datetime.fromisoformat(record[4]))
-                            )
-                            exists = self.main_cursor.fetchone()[0] > 0
-                            if not exists:
-                                self.main_cursor.execute(
-                                    "EXEC aiStpInsertFrameIngot @cameraId=?, @width=?, @height=?, @frameDateTime=?, @frame=?, @memo=?",
-                                    (record[1], record[3], record[2], datetime.datetime.fromisoformat(record[4]), record[5], record[6])
-                                )
-                    self.main_conn.commit()
+                    with self.main_lock:
+                        existing = self._existing_in_main(table, records)
+                        missing = [record for record in records if record[0] not in existing]
+                        if missing:
+                            self._insert_main(table, missing)
+                        self.main_conn.commit()
                     ids = [record[0] for record in records]
-                    self.local_cursor.execute(f"UPDATE {table} SET synced = 1 WHERE id IN ({','.join('?'*len(ids))})", ids)
-                    self.local_conn.commit()
-                    logger.info(f"🔄 Synced {len(records)} records from {table}")
+                    with self.local_lock:
+                        self.local_cursor.execute(f"UPDATE {table} SET synced = 1 WHERE id IN ({','.join('?'*len(ids))})", ids)
+                        self.local_conn.commit()
                 except Exception as e:
-                    self.main_conn.rollback()
                     logger.error(f"❌ Sync error in {table}: {e}")
-                    time.sleep(5)
-                    self._connect_to_main_db()
+                    self.sync_batch_size = max(SYNC_MIN_BATCH, self.sync_batch_size // 2)
+                    with self.main_lock:
+                        # the writer thread may have reconnected or dropped the connection meanwhile
+                        try:
+                            if self.main_conn:
+                                self.main_conn.rollback()
+                        except Exception as rollback_error:
+                            logger.warning(f"⚠️ Rollback after sync error failed: {rollback_error}")
+                    # back off without holding main_lock so the writer keeps going
+                    self._closed.wait(5)
+                    with self.main_lock:
+                        self._connect_to_main_db()
                     break
-                self.local_cursor.execute(f"SELECT * FROM {table} WHERE synced = 0 ORDER BY id ASC LIMIT {batch_size}")
-                records = self.local_cursor.fetchall()
+                synced += len(records)
+                self._adapt_batch_size(time.monotonic() - t0)
+                self._report_sync_progress(table, synced, len(records) - len(missing), started)
+                records = self._fetch_unsynced(table, self.sync_batch_size)
+
+    def _fetch_unsynced(self, table, limit):
+        with self.local_lock:
+            self.local_cursor.execute(
+                f"SELECT {SYNC_TABLES[table]['local_columns']} FROM {table} WHERE synced = 0 ORDER BY id ASC LIMIT {limit}"
+            )
+            return self.local_cursor.fetchall()
+
+    def _insert_main(self, table, records):
+        """Insert rows read with local_columns into the main table; the caller holds main_lock and commits."""
+        spec = SYNC_TABLES[table]
+        frames = self._main_frames(table, records)
+        self.main_cursor.fast_executemany = settings.SYNC_FAST_EXECUTEMANY
+        self.main_cursor.executemany(
+            spec["insert"], [spec["params"](record, frame, memo) for record, (frame, memo) in zip(records, frames)]
+        )
+
+    def _main_frames(self, table, records):
+        """(frame bytes, memo) to send with each row.
+
+        Legacy rows carry their own BLOB. Frame store rows read each distinct
+        frame from disk once per batch; with FRAME_STORE_MAIN_TABLE set the
+        frame is uploaded there at most once and the row only references it
+        from its memo.
+        """
+        ref_col, blob_col, memo_col = SYNC_TABLES[table]["frame_columns"]
+        refs = {record[ref_col] for record in records if record[ref_col]}
+        if settings.FRAME_STORE_MAIN_TABLE:
+            self._upload_frames(refs)
+            return [
+                (None, frame_memo(r[memo_col], FrameStore.digest(r[ref_col]))) if r[ref_col] else (r[blob_col], r[memo_col])
+                for r in records
+            ]
+        frames = {ref: self.frame_store.get(ref) for ref in refs}
+        return [(frames[r[ref_col]] if r[ref_col] else r[blob_col], r[memo_col]) for r in records]
+
+    def _upload_frames(self, refs):
+        """Send frames not uploaded yet to FRAME_STORE_MAIN_TABLE and remember them locally."""
+        if not refs:
+            return
+        refs = list(refs)
+        with self.local_lock:
+            self.local_cursor.execute(f"SELECT ref FROM frame_uploads WHERE ref IN ({','.join('?'*len(refs))})", refs)
+            known = {row[0] for row in self.local_cursor.fetchall()}
+        uploads = []
+        for ref in refs:
+            if ref in known:
+                continue
+            data = self.frame_store.get(ref)
+            if data is not None:
+                digest = FrameStore.digest(ref)
+                uploads.append((ref, (digest, digest, data)))
+        if not uploads:
+            return
+        table = settings.FRAME_STORE_MAIN_TABLE
+        self.main_cursor.fast_executemany = settings.SYNC_FAST_EXECUTEMANY
+        self.main_cursor.executemany(
+            f"IF NOT EXISTS (SELECT 1 FROM {table} WHERE frameHash = ?) INSERT INTO {table} (frameHash, frame) VALUES (?, ?)",
+            [params for _, params in uploads]
+        )
+        self.main_conn.commit()
+        with self.local_lock:
+            self.local_cursor.executemany("INSERT OR IGNORE INTO frame_uploads (ref) VALUES (?)", [(ref,) for ref, _ in uploads])
+            self.local_conn.commit()
+        self.frames_uploaded += len(uploads)
+
+    def _existing_in_main(self, table, records):
+        """Return the local ids in ``records`` whose key already exists in the main table, in one round-trip.
+
+        Keys are loaded into a temp table cloned from the main table's key
+        columns, so the server compares values with its own types (datetime
+        rounding included) exactly as the per-row check used to.
+        """
+        spec = SYNC_TABLES[table]
+        columns = ", ".join(spec["key_columns"])
+        temp = f"#sync_{table}"
+        self.main_cursor.execute(f"IF OBJECT_ID('tempdb..{temp}') IS NOT NULL DROP TABLE {temp}")
+        self.main_cursor.execute(f"SELECT TOP 0 {columns} INTO {temp} FROM {spec['main_table']}")
+        self.main_cursor.execute(f"ALTER TABLE {temp} ADD localId INT")
+        self.main_cursor.fast_executemany = True
+        self.main_cursor.executemany(
+            f"INSERT INTO {temp} ({columns}, localId) VALUES ({', '.join('?' * (len(spec['key_columns']) + 1))})",
+            [spec["key"](record) + (record[0],) for record in records]
+        )
+        join = " AND ".join(f"t.{c} = k.{c}" for c in spec["key_columns"])
+        self.main_cursor.execute(f"SELECT DISTINCT k.localId FROM {temp} k JOIN {spec['main_table']} t ON {join}")
+        existing = {row[0] for row in self.main_cursor.fetchall()}
+        self.main_cursor.execute(f"DROP TABLE {temp}")
+        return existing
+
+    def _adapt_batch_size(self, duration):
+        """Grow the batch while batches finish well under the target time, shrink it when they overrun."""
+        target = settings.SYNC_TARGET_BATCH_SECONDS
+        if duration < target / 2:
+            self.sync_batch_size = min(SYNC_MAX_BATCH, self.sync_batch_size * 2)
+        elif duration > target:
+            self.sync_batch_size = max(SYNC_MIN_BATCH, int(self.sync_batch_size * target / duration))
+
+    def _report_sync_progress(self, table, synced, skipped, started):
+        with self.local_lock:
+            self.local_cursor.execute(f"SELECT COUNT(*), MIN(frame_datetime) FROM {table} WHERE synced = 0")
+            pending, oldest = self.local_cursor.fetchone()
+        lag = 0.0
+        if oldest:
+            lag = (datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(oldest)).total_seconds()
+        elapsed = time.monotonic() - started
+        rate = synced / elapsed if elapsed > 0 else 0.0
+        self.sync_stats[table] = {
+            "synced": synced, "pending": pending, "lag_seconds": lag,
+            "rows_per_second": rate, "batch_size": self.sync_batch_size
+        }
+        logger.info(
+            f"🔄 {table}: synced {synced} ({skipped} already present), {pending} pending, "
+            f"lag {lag:.0f}s, {rate:.0f} rows/s, next batch {self.sync_batch_size}"
+        )
 
     def _sync_periodically(self):
-        """Run synchronization every 30 seconds."""
-        while True:
+        """Run synchronization every 30 seconds and local retention every LOCAL_DB_MAINTENANCE_INTERVAL."""
+        while not self._closed.is_set():
             logger.info("🔄 Starting periodic sync")
-            self.synchronize()
-            time.sleep(30)
-
-    def close(self):
-        """Close all database connections."""
-        if self.main_conn:
-            self.main_conn.close()
-        self.local_conn.close()
+            try:
+                self.synchronize()
+            except Exception as e:
+                # a failed round must not end the thread: nothing would reach SQL Server any more
+                logger.error(f"❌ Periodic sync failed: {e}")
+            if time.monotonic() - self._last_maintenance >= settings.LOCAL_DB_MAINTENANCE_INTERVAL:
+                self.maintain_local_store()
+            self._closed.wait(30)
+
+    def maintain_local_store(self):
+        """Apply the retention policy to the local database."""
+        self._last_maintenance = time.monotonic()
+        try:
+            with self.local_lock:
+                _, _, prune_before = apply_retention(self.local_conn, frame_store=True)
+            # deleting day shards must not hold up the writer
+            self.frame_store.prune(prune_before)
+            logger.info(f"🗄️ Local database: {self.local_stats()}")
+        except Exception as e:
+            logger.error(f"❌ Local retention failed: {e}")
+
+    def local_stats(self):
+        """Local database size and pending-row counts."""
+        with self.local_lock:
+            stats = local_store_stats(self.local_conn, self.local_db_path)
+        stats.update(self.frame_store.stats())
+        stats["frames_uploaded"] = self.frames_uploaded
+        return stats
+
+    def close(self, timeout=30):
+        """Stop the sync thread, then close all database connections."""
+        self._closed.set()
+        self.sync_thread.join(timeout=timeout)
+        if self.sync_thread.is_alive():
+            logger.warning(f"⚠️ Sync thread did not finish within {timeout}s")
+        with self.main_lock:
+            if self.main_conn:
+                self.main_conn.close()
+        with self.local_lock:
+            self.local_conn.close()
         logger.info("🔚 Database connections closed.")
\ No newline at end of file
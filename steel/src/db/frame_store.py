@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _tree_bytes(root):
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class FrameStore:
+    """Content-addressed store for evidence JPEGs.
+
+    A frame lives at ``<root>/<YYYY-MM-DD>/<hash[:2]>/<hash>.jpg``, where
+    the hash is the SHA-256 of its bytes and the date is the frame's
+    capture date. Rows keep the relative path (the ref) instead of the
+    bytes, so identical frame bytes are stored once. Whole days are pruned
+    at a time. Use ``get_frame_store`` so every logger in a process shares
+    one store and its byte count.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.FRAME_STORE_PATH
+        os.makedirs(self.root, exist_ok=True)
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes = _tree_bytes(self.root)
+        self._dirs = set()
+        self._lock = threading.Lock()
+
+    def put(self, jpeg, frame_datetime):
+        """Store ``jpeg`` once and return its ref."""
+        digest = hashlib.sha256(jpeg).hexdigest()
+        ref = f"{frame_datetime.date().isoformat()}/{digest[:2]}/{digest}.jpg"
+        path = os.path.join(self.root, ref)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+            return ref
+        directory = os.path.dirname(path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        # write-then-rename so a reader never sees half a frame
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(jpeg)
+        os.replace(tmp, path)
+        with self._lock:
+            self.stored += 1
+            self.bytes += len(jpeg)
+        return ref
+
+    def get(self, ref):
+        """The frame's bytes, or None once it has been pruned."""
+        try:
+            with open(os.path.join(self.root, ref), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def digest(ref):
+        return os.path.splitext(os.path.basename(ref))[0]
+
+    def prune(self, before_day):
+        """Delete every day shard older than ``before_day`` (an ISO date string)."""
+        removed = []
+        for day in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, day)
+            if day < before_day and os.path.isdir(path):
+                size = _tree_bytes(path)
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(day)
+                with self._lock:
+                    self.bytes -= size
+        if removed:
+            with self._lock:
+                self._dirs.clear()
+            logger.info(f"🧹 Frame store: removed {len(removed)} day shards before {before_day}")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"store_bytes": self.bytes, "stored": self.stored, "deduplicated": self.deduplicated}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_frame_store(root=None):
+    """The process-wide store at ``root`` (FRAME_STORE_PATH by default); only the first call sizes the tree."""
+    root = os.path.abspath(root or settings.FRAME_STORE_PATH)
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = FrameStore(root)
+        return store
@@ -0,0 +1,249 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+import cv2
+from monitoring.metrics import observe_stage
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def roi_thumbnail(frame, bbox, max_side=None, quality=None):
+    """A small JPEG of the ``bbox`` region of ``frame``, or None when the region is empty."""
+    max_side = max_side or settings.FRAME_THUMBNAIL_SIZE
+    height, width = frame.shape[:2]
+    x1, y1 = max(0, int(bbox["x_min"])), max(0, int(bbox["y_min"]))
+    x2, y2 = min(width, int(bbox["x_max"])), min(height, int(bbox["y_max"]))
+    crop = frame[y1:y2, x1:x2]
+    if not crop.size:
+        return None
+    scale = max_side / max(crop.shape[:2])
+    if scale < 1:
+        size = (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, quality or settings.FRAME_THUMBNAIL_QUALITY])
+    return buffer.tobytes()
+
+
+class DiskQuota:
+    """Keeps the images under a set of directories within a byte budget.
+
+    Files already on disk are picked up at start, oldest first; every write
+    is recorded and, once the total exceeds ``max_bytes``, the oldest images
+    are deleted until it fits again (rotation). Rewriting a path replaces
+    its size and makes it the newest.
+    """
+
+    def __init__(self, max_bytes, roots):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.evicted = 0
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        existing = []
+        for root in roots:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    existing.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(existing):
+            self._files[path] = size
+            self.used += size
+        self._enforce()
+
+    def add(self, path, size):
+        with self._lock:
+            self.used += size - self._files.pop(path, 0)
+            self._files[path] = size
+        self._enforce()
+
+    def _enforce(self):
+        victims = []
+        with self._lock:
+            # never evict the file just written
+            while self.used > self.max_bytes and len(self._files) > 1:
+                path, size = self._files.popitem(last=False)
+                self.used -= size
+                victims.append(path)
+            self.evicted += len(victims)
+        for path in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ Could not remove {path} while enforcing the image quota: {e}")
+        if victims:
+            logger.info(f"Image quota: removed {len(victims)} oldest images, {self.used / 2**20:.0f} MB in use")
+
+    def stats(self):
+        with self._lock:
+            return {"used_bytes": self.used, "files": len(self._files), "evicted": self.evicted}
+
+
+_quota = None
+_quota_lock = threading.Lock()
+
+
+def get_disk_quota():
+    """The process-wide quota over FRAMES_PATH and CROPPED_IMAGES_PATH, or None when disabled."""
+    global _quota
+    if settings.IMAGE_SINK_QUOTA_MB <= 0:
+        return None
+    with _quota_lock:
+        if _quota is None:
+            _quota = DiskQuota(
+                settings.IMAGE_SINK_QUOTA_MB * 2**20, [settings.FRAMES_PATH, settings.CROPPED_IMAGES_PATH]
+            )
+        return _quota
+
+
+class ImageSink:
+    """Encodes and stores evidence images off the inference thread.
+
+    ``submit`` only enqueues. ``frame`` may also be a callable returning the
+    frame, such as an on-demand full-resolution decode, which then runs on
+    a worker thread too. Worker threads apply the optional ``draw``
+    callable to a copy of the frame, encode it once, write the bytes to
+    ``path`` and hand the same bytes to ``record``, typically a DB log call,
+    together with a thumbnail of ``thumbnail_roi`` when one is given.
+    ``jpeg`` is stored as is when the frame is neither drawn on nor a
+    callable; otherwise it is only the fallback ``record`` gets when the
+    image cannot be made. When the queue is full the image is dropped and
+    counted, but ``record`` still runs inline, with ``jpeg`` or a plain
+    encoding of the frame, so events are never lost. ``record`` runs once
+    per image, whatever fails.
+    """
+
+    def __init__(self, workers=None, max_queue=None, quality=None, quota=None):
+        self.quality = quality or settings.IMAGE_SINK_JPEG_QUALITY
+        self.quota = quota if quota is not None else get_disk_quota()
+        self._queue = queue.Queue(maxsize=max_queue or settings.IMAGE_SINK_QUEUE_SIZE)
+        self._dirs = set()
+        self.submitted = 0
+        self.encoded = 0
+        self.reused = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True, name=f"image-sink-{i}")
+            for i in range(workers or settings.IMAGE_SINK_WORKERS)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, camera_id, frame, path=None, jpeg=None, draw=None, record=None, thumbnail_roi=None):
+        """Queue one evidence image. ``frame`` must not be modified by the caller afterwards."""
+        try:
+            self._queue.put_nowait((time.monotonic(), camera_id, frame, path, jpeg, draw, record, thumbnail_roi))
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"❌ Image sink queue full, dropped image for {camera_id} ({self.dropped} dropped so far)")
+            if record is not None:
+                self._record(record, self._fallback_jpeg(frame, jpeg), None)
+
+    def _fallback_jpeg(self, frame, jpeg):
+        """``jpeg``, else a plain encoding of ``frame``; None for a callable frame, which may be slow to resolve."""
+        if jpeg is not None or callable(frame):
+            return jpeg
+        try:
+            return self._encode(frame)
+        except Exception as e:
+            logger.error(f"❌ Failed to encode evidence image: {e}")
+            return None
+
+    @staticmethod
+    def _record(record, jpeg, thumbnail):
+        try:
+            record(jpeg, thumbnail)
+        except Exception as e:
+            logger.error(f"❌ Failed to record evidence image: {e}")
+
+    def _encode(self, frame):
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        self.encoded += 1
+        return buffer.tobytes()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            enqueued_at, camera_id, frame, path, jpeg, draw, record, thumbnail_roi = job
+            data = thumbnail = None
+            try:
+                data, thumbnail = self._image(camera_id, frame, jpeg, draw, thumbnail_roi if record else None)
+                if path:
+                    self._write(path, data)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Failed to store evidence image: {e}")
+                if data is None:
+                    data = jpeg
+            if record is not None:
+                self._record(record, data, thumbnail)
+            observe_stage(camera_id, "image_sink", time.monotonic() - enqueued_at)
+
+    def _image(self, camera_id, frame, jpeg, draw, thumbnail_roi):
+        """The JPEG to store and the thumbnail of ``thumbnail_roi`` (None without one)."""
+        if callable(frame):
+            t0 = time.perf_counter()
+            frame = frame()
+            observe_stage(camera_id, "evidence_decode", time.perf_counter() - t0)
+            jpeg = None
+        thumbnail = roi_thumbnail(frame, thumbnail_roi) if thumbnail_roi else None
+        if draw is not None:
+            # other jobs may still be encoding this frame; draw on a copy
+            t0 = time.perf_counter()
+            frame = frame.copy()
+            draw(frame)
+            observe_stage(camera_id, "annotate", time.perf_counter() - t0)
+            jpeg = None
+        if jpeg is None:
+            jpeg = self._encode(frame)
+        else:
+            self.reused += 1
+        return jpeg, thumbnail
+
+    def _write(self, path, jpeg):
+        directory = os.path.dirname(path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        with open(path, "wb") as f:
+            f.write(jpeg)
+        self.written += 1
+        if self.quota:
+            self.quota.add(path, len(jpeg))
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "submitted": self.submitted,
+            "encoded": self.encoded,
+            "reused": self.reused,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def close(self, timeout=30):
+        """Finish queued images, then stop the workers."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            logger.warning(f"⚠️ Image sink did not finish within {timeout}s, {self._queue.qsize()} images left")
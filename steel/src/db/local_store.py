@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TABLES = ("barcodes", "ingots")
+
+# databases already tuned by this process; every consumer opens its own DatabaseLogger on the same file
+_tuned_paths = set()
+_tuning_lock = threading.Lock()
+
+
+def open_local_db(path):
+    """Open the local SQLite buffer with WAL and pragmas tuned for many small writes."""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    # auto_vacuum only takes effect on a fresh file or after a full VACUUM (see ensure_schema_tuning)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = -{settings.LOCAL_DB_CACHE_KB}")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def ensure_schema_tuning(conn, path):
+    """Add sync/retention indexes and convert an old database to incremental auto-vacuum.
+
+    Runs once per database file and process: consumers starting together
+    wait for the first one instead of queueing their own full VACUUM
+    behind it until busy_timeout.
+    """
+    key = os.path.abspath(path)
+    with _tuning_lock:
+        if key in _tuned_paths:
+            return
+        cursor = conn.cursor()
+        for table in LOCAL_TABLES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_unsynced ON {table}(id) WHERE synced = 0")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_synced_datetime ON {table}(frame_datetime) WHERE synced = 1")
+        conn.commit()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("🧹 Converting local database to incremental auto-vacuum (one-off full VACUUM)")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        _tuned_paths.add(key)
+
+
+def ensure_frame_columns(conn):
+    """Add the frame store columns to a database created before frames moved out of the rows."""
+    cursor = conn.cursor()
+    for table in LOCAL_TABLES:
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+        for column, kind in (("frame_ref", "TEXT"), ("thumbnail", "BLOB")):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+    conn.commit()
+
+
+def apply_retention(conn, frame_store=False):
+    """Thin and prune synced rows according to the retention settings, then release free pages.
+
+    Synced rows older than LOCAL_DB_BLOB_RETENTION_HOURS lose their frame
+    (BLOB or frame store ref; the thumbnail stays); synced rows older than
+    LOCAL_DB_ROW_RETENTION_DAYS are deleted. Unsynced rows are never
+    touched. Returns (thinned, deleted, prune_before): with ``frame_store``,
+    ``prune_before`` is the ISO day before which frame store shards may be
+    deleted, never past the oldest unsynced row; the caller prunes them
+    after releasing the connection, since deleting shards can take a while.
+    """
+    now = datetime.now(ZoneInfo(settings.LOCAL_TIMEZONE))
+    blob_cutoff = (now - timedelta(hours=settings.LOCAL_DB_BLOB_RETENTION_HOURS)).isoformat()
+    row_cutoff = (now - timedelta(days=settings.LOCAL_DB_ROW_RETENTION_DAYS)).isoformat()
+    cursor = conn.cursor()
+    thinned = deleted = 0
+    prune_before = None
+    for table in LOCAL_TABLES:
+        cursor.execute(
+            f"UPDATE {table} SET frame_data = NULL, frame_ref = NULL "
+            f"WHERE synced = 1 AND frame_datetime < ? AND (frame_data IS NOT NULL OR frame_ref IS NOT NULL)",
+            (blob_cutoff,)
+        )
+        thinned += cursor.rowcount
+        cursor.execute(f"DELETE FROM {table} WHERE synced = 1 AND frame_datetime < ?", (row_cutoff,))
+        deleted += cursor.rowcount
+    if frame_store:
+        prune_before = blob_cutoff[:10]
+        for table in LOCAL_TABLES:
+            oldest = cursor.execute(f"SELECT MIN(frame_datetime) FROM {table} WHERE synced = 0").fetchone()[0]
+            if oldest:
+                prune_before = min(prune_before, oldest[:10])
+        # refs start with their day, so this forgets uploads of the days about to be pruned only
+        cursor.execute("DELETE FROM frame_uploads WHERE ref < ?", (prune_before,))
+    conn.commit()
+    cursor.execute(f"PRAGMA incremental_vacuum({settings.LOCAL_DB_VACUUM_PAGES})")
+    cursor.fetchall()
+    if thinned or deleted:
+        logger.info(f"🧹 Local retention: dropped {thinned} frame blobs, deleted {deleted} rows")
+    return thinned, deleted, prune_before
+
+
+def local_store_stats(conn, path):
+    cursor = conn.cursor()
+    page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    wal_path = f"{path}-wal"
+    stats = {
+        "db_bytes": page_count * page_size,
+        "free_bytes": free_pages * page_size,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+    for table in LOCAL_TABLES:
+        stats[f"{table}_pending"] = cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE synced = 0").fetchone()[0]
+    return stats
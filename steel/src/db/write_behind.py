@@ -0,0 +1,118 @@
+import logging
+import queue
+import threading
+import time
+from monitoring.metrics import observe_stage
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindLogger:
+    """Non-blocking front for DatabaseLogger.
+
+    ``log_barcode``/``log_ingot`` only enqueue the record. A writer thread
+    drains the bounded queue in batches, writes each batch to SQLite in one
+    transaction and pushes it to the main database, so a slow or unreachable
+    SQL Server never stalls frame processing. When the queue stays full for
+    ``put_timeout`` the caller writes the record to SQLite itself (spilled)
+    and the periodic sync sends it on; a record is only dropped if that
+    local write fails too.
+    """
+
+    def __init__(self, db_logger, max_queue=None, batch_size=None, flush_interval=None, put_timeout=None):
+        self.db_logger = db_logger
+        self.batch_size = batch_size or settings.DB_WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.DB_WRITE_FLUSH_INTERVAL
+        self.put_timeout = settings.DB_WRITE_PUT_TIMEOUT if put_timeout is None else put_timeout
+        self._queue = queue.Queue(maxsize=max_queue or settings.DB_WRITE_QUEUE_SIZE)
+        self.enqueued = 0
+        self.written = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="db-write-behind")
+        self._thread.start()
+
+    def log_barcode(self, camera_id, barcode, frame_datetime, frame_data, memo, thumbnail=None):
+        self._put(("barcodes", (camera_id, barcode, frame_datetime, frame_data, memo, thumbnail)))
+
+    def log_ingot(self, camera_id, height, width, frame_datetime, frame_data, memo, thumbnail=None):
+        self._put(("ingots", (camera_id, height, width, frame_datetime, frame_data, memo, thumbnail)))
+
+    def _put(self, record):
+        try:
+            self._queue.put((time.monotonic(), record), timeout=self.put_timeout)
+            self.enqueued += 1
+            return
+        except queue.Full:
+            pass
+        try:
+            # local only: the caller must not wait on SQL Server, the periodic sync pushes the row
+            self.db_logger.write_batch([record], push_to_main=False)
+            self.spilled += 1
+            logger.warning(f"⚠️ Database write queue full, wrote {record[0]} record to SQLite directly ({self.spilled} so far)")
+        except Exception as e:
+            self.dropped += 1
+            logger.error(f"❌ Database write queue full and local write failed, dropped {record[0]} record: {e}")
+
+    def _drain(self):
+        """Block for the first record, then take whatever else is ready up to batch_size."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], False
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._drain()
+            if not batch:
+                continue
+            try:
+                self.db_logger.write_batch([record for _, record in batch])
+                self.written += len(batch)
+                now = time.monotonic()
+                for enqueued_at, (_, values) in batch:
+                    observe_stage(values[0], "db_write", now - enqueued_at)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"❌ Failed to write batch of {len(batch)} records: {e}")
+            self.last_latency = time.monotonic() - batch[0][0]
+            self.max_latency = max(self.max_latency, self.last_latency)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+        }
+
+    def close(self, timeout=30):
+        """Flush queued records, stop the writer and close the underlying logger."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Database writer did not finish within {timeout}s, {self._queue.qsize()} records left")
+        self.db_logger.close()
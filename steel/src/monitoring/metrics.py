@@ -0,0 +1,216 @@
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# seconds; covers sub-millisecond ring writes up to multi-second OCR/DB stalls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def sum(self, *prefix):
+        """Total over every label set that starts with ``prefix`` (e.g. one camera, all reasons)."""
+        n = len(prefix)
+        with self._lock:
+            return sum(v for labels, v in self._values.items() if labels[:n] == prefix)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def remove(self, *labels):
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, *labels):
+        """(bucket counts, sum, count) for one label set, or None."""
+        with self._lock:
+            series = self._series.get(labels)
+            return None if series is None else (list(series[0]), series[1], series[2])
+
+    def quantile(self, q, *labels):
+        """Estimate a quantile from the bucket counts, interpolating linearly inside the
+        bucket it falls in (as Prometheus' histogram_quantile does)."""
+        snap = self.snapshot(*labels)
+        if not snap or not snap[2]:
+            return None
+        counts, _, total = snap
+        target = q * total
+        running = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            if count and running + count >= target:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (target - running) / count
+            running += count
+            lower = bound
+        return lower
+
+    def label_sets(self):
+        with self._lock:
+            return list(self._series)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, (counts, total, count) in self._series.items():
+                running = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    running += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {running}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """Register a callable run at scrape time, e.g. to refresh gauges from component stats."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def remove_collector(self, fn):
+        with self._lock:
+            if fn in self._collectors:
+                self._collectors.remove(fn)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for fn in collectors:
+            # one failing collector (e.g. a locked SQLite database) must not cost the whole scrape
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"❌ Metrics collector {getattr(fn, '__qualname__', fn)} failed: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# stage is one of: read, encode, publish, queue_wait, decode, ocr, yolo, evidence_decode, annotate, image_sink,
+# db_write, end_to_end
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "steel_stage_seconds", "Time spent per pipeline stage", ("camera", "stage")
+))
+FRAMES_TOTAL = REGISTRY.register(Counter(
+    "steel_frames_total", "Frames handled per camera and side", ("camera", "side")
+))
+# reason: transport (overwritten/expired/conflated in the queue or ring), stale (older than the
+# backpressure max age when received), throttled (not published while the producer backs off)
+DROPPED_FRAMES = REGISTRY.register(Counter(
+    "steel_dropped_frames_total", "Frames not analysed, by where they were dropped", ("camera", "reason")
+))
+# decision: full, skip_ocr, skip_yolo (degradation ladder), no_sleep (catching up)
+SCHEDULER_DECISIONS = REGISTRY.register(Counter(
+    "steel_scheduler_decisions_total", "Per-frame consumer scheduling decisions", ("camera", "decision")
+))
+EVENTS_TOTAL = REGISTRY.register(Counter(
+    "steel_events_total", "Ingots counted and barcodes committed", ("camera", "kind")
+))
+COMPONENT_GAUGE = REGISTRY.register(Gauge(
+    "steel_component_value", "Point-in-time component stats (queue depth, DB size, ...)", ("component", "camera", "stat")
+))
+
+
+def observe_stage(camera, stage, seconds):
+    STAGE_SECONDS.observe(seconds, camera, stage)
+
+
+def render():
+    return REGISTRY.render()
@@ -1,5 +1,4 @@
 import logging
-import pickle
 import time
 import cv2
 import numpy as np
@@ -9,10 +8,19 @@ from zoneinfo import ZoneInfo
 
 import os
 import csv
-from rabbitmq.client import RabbitMQClient
-from ai.barcode import process_frame_for_barcode
+from functools import partial
+from transport.backpressure import backpressure_policy
+from transport.factory import create_transport
+from capture.roi import to_local_bbox, tracks_to_full
+from capture.evidence import decode_or_upscale, get_evidence_buffer
+from ai.barcode import ChangeGate, process_frame_for_barcode
 from ai.counter import IngotCounter
+from ai.track_barcodes import TrackBarcodeVoter
 from db.database import DatabaseLogger
+from db.image_sink import ImageSink
+from db.write_behind import WriteBehindLogger
+from processing.scheduler import scheduler_for
+from monitoring.metrics import REGISTRY, COMPONENT_GAUGE, DROPPED_FRAMES, EVENTS_TOTAL, FRAMES_TOTAL, observe_stage
 from config.config import settings
 
 last_saved_barcodes = {}
@@ -20,18 +28,58 @@ last_saved_barcodes = {}
 logger = logging.getLogger(__name__)
 logging.getLogger().setLevel(logging.INFO)
 
-def save_image_to_folder(cropped_image, barcode):
-    os.makedirs(settings.CROPPED_IMAGES_PATH, exist_ok=True)
+def label_crop(cropped_image, barcode):
     cv2.putText(cropped_image, barcode, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+
+def save_image_to_folder(image_sink, source_id, cropped_image, barcode):
+    """Queue the labelled barcode crop for CROPPED_IMAGES_PATH."""
     image_filename = os.path.join(settings.CROPPED_IMAGES_PATH, f"{barcode}.jpg")
-    cv2.imwrite(image_filename, cropped_image)
-    logger.info(f"Saved cropped image with barcode {barcode} to {image_filename}")
-
-def frame_consumer(source_id, source_path=None, source_type='camera', stop_event=None):
-    if source_type == 'camera':
-        source_info = settings.CAMERAS.get(source_id)
-    elif source_type == 'video':
-        source_info = settings.VIDEOS.get(source_id)
+    image_sink.submit(source_id, cropped_image, path=image_filename, draw=partial(label_crop, barcode=barcode))
+    logger.info(f"Queued cropped image with barcode {barcode} for {image_filename}")
+
+def log_barcode_event(image_sink, db_logger, source_id, barcode, frame_datetime, frame, roi, jpeg=None):
+    """Queue the barcode's evidence frame; the DB row gets the single encoding the sink makes (or ``jpeg``,
+    see ImageSink) and a thumbnail of ``roi``."""
+    image_sink.submit(
+        source_id, frame, jpeg=jpeg, thumbnail_roi=roi,
+        record=lambda data, thumbnail: db_logger.log_barcode(source_id, barcode, frame_datetime, data, "", thumbnail)
+    )
+
+def log_packet_barcode(image_sink, db_logger, source_id, barcode, packet, local_bbox, bbox):
+    """Log a barcode read from ``packet`` with that packet's time and image (full resolution when buffered)."""
+    frame_datetime = datetime.fromtimestamp(packet.timestamp, tz=ZoneInfo("Asia/Tehran"))
+    full = full_resolution_frame(source_id, packet)
+    frame, roi = (full, bbox) if full is not None else (packet.frame, local_bbox)
+    # the producer's JPEG is stored as is for the feed frame and is the fallback for a full-resolution one
+    log_barcode_event(image_sink, db_logger, source_id, barcode, frame_datetime, frame, roi, packet.cached_jpeg())
+
+def annotate(frame, tracks, counting_line_x, ingot_count):
+    for x1, y1, x2, y2 in tracks[:, :4].astype(int).tolist():
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+    cv2.line(frame, (counting_line_x, 0), (counting_line_x, frame.shape[0]), (0, 255, 0), 2)
+    cv2.putText(frame, f"ingot_count: {ingot_count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+
+def full_resolution_frame(source_id, packet):
+    """A callable decoding the main-stream frame matching a dual-stream packet, or None when none is buffered.
+
+    The image sink calls it on its own threads, so the consumer never waits for the decode.
+    """
+    evidence = get_evidence_buffer(source_id)
+    clip = evidence.clip(packet.timestamp) if evidence else None
+    return partial(decode_or_upscale, clip, packet) if clip else None
+
+def frame_consumer(source_id, source_path=None, source_type='camera', stop_event=None,
+                   source_info=None, transport=None, counter=None, db_logger=None):
+    """Consume and analyse frames for one source until ``stop_event`` is set.
+
+    ``source_info``, ``transport``, ``counter`` and ``db_logger`` default to
+    the configured ones; the benchmark harness passes its own.
+    """
+    if source_info is None:
+        if source_type == 'camera':
+            source_info = settings.CAMERAS.get(source_id)
+        elif source_type == 'video':
+            source_info = settings.VIDEOS.get(source_id)
     if not source_info:
         logger.error(f"Source {source_id} not found in configuration")
         return
@@ -39,91 +87,183 @@ def frame_consumer(source_id, source_path=None, source_type='camera', stop_event
     bbox = source_info.get('bbox', settings.DEFAULT_BBOX)
     counting_line_x = source_info.get('counting_line_x', settings.DEFAULT_COUNTING_LINE_X)
 
-    rabbitmq_client = RabbitMQClient(
-        settings.RABBITMQ_HOST, settings.RABBITMQ_PORT,
-        settings.RABBITMQ_USER, settings.RABBITMQ_PASS
-    )
-    rabbitmq_client.connect()
+    transport = transport or create_transport(source_id, source_info)
+    max_age = backpressure_policy(source_info).max_age
+    scheduler = scheduler_for(source_id, source_info)
 
-    counter = IngotCounter(
-        model_path='src/ai/weights/best.pt',
+    counter = counter or IngotCounter(
+        model_path=settings.YOLO_WEIGHTS,
         counting_line_x=counting_line_x,
-        rabbitmq_client=rabbitmq_client,
+        rabbitmq_client=None,
         queue_name=f"frame_queue_{source_id}",
         match_threshold=5
     )
-    db_logger = DatabaseLogger()
+    voter = None
+    ocr_gate = None
+    if source_info.get('barcode_mode', settings.BARCODE_MODE) == 'track':
+        voter = TrackBarcodeVoter(
+            bbox,
+            max_reads=settings.BARCODE_MAX_READS_PER_TRACK,
+            min_votes=settings.BARCODE_MIN_VOTES
+        )
+    elif source_info.get('ocr_gate', settings.OCR_GATE_ENABLED):
+        ocr_gate = ChangeGate(threshold=source_info.get('ocr_gate_threshold', settings.OCR_GATE_THRESHOLD))
+    db_logger = db_logger or WriteBehindLogger(DatabaseLogger())
+    image_sink = ImageSink()
     output_dir = os.path.join(settings.FRAMES_PATH, source_id)
     os.makedirs(output_dir, exist_ok=True)
 
+    def collect_stats():
+        for stat, value in db_logger.stats().items():
+            COMPONENT_GAUGE.set(value, "db_writer", source_id, stat)
+        for stat, value in image_sink.stats().items():
+            COMPONENT_GAUGE.set(value, "image_sink", source_id, stat)
+        if image_sink.quota:
+            for stat, value in image_sink.quota.stats().items():
+                COMPONENT_GAUGE.set(value, "image_quota", "all", stat)
+        if ocr_gate:
+            COMPONENT_GAUGE.set(ocr_gate.skipped, "ocr", source_id, "skipped")
+            COMPONENT_GAUGE.set(ocr_gate.executed, "ocr", source_id, "executed")
+        if voter:
+            COMPONENT_GAUGE.set(voter.ocr_calls, "ocr", source_id, "executed")
+        for stat, value in db_logger.db_logger.local_stats().items():
+            COMPONENT_GAUGE.set(value, "local_db", source_id, stat)
+        for table, stats in db_logger.db_logger.sync_stats.items():
+            for stat, value in stats.items():
+                COMPONENT_GAUGE.set(value, f"sync_{table}", source_id, stat)
+    REGISTRY.add_collector(collect_stats)
+    dropped_seen = 0
+    consumer_started = time.time()
+
     frame_count = 0
     ingot_count = 0
     target_time = 1.0 / settings.FRAME_RATE
+    offset = (0, 0)
+    scale = 1.0
+    local_bbox = bbox
+    local_line_x = counting_line_x
 
     try:
         while stop_event is None or not stop_event.is_set():
             t_start = time.time()
 
-            msg = rabbitmq_client.basic_get(f"frame_queue_{source_id}")
-            if msg is None:
+            packet = transport.receive(timeout=0.05)
+            if packet is None:
                 logger.info(f"{source_id} - No frames available, Waiting...")
-                time.sleep(0.05)
                 continue
-
-            data = pickle.loads(msg)
-            compressed_frame = data['frame']
-            timestamp = data['timestamp']
-            frame = cv2.imdecode(np.frombuffer(compressed_frame, np.uint8), cv2.IMREAD_COLOR)
-            if frame is None:
-                logger.warning(f"{source_id} - corrupted frame detected, Skipping...")
+            frame = packet.frame
+            timestamp = packet.timestamp
+            age = time.time() - timestamp
+            observe_stage(source_id, "queue_wait", age)
+            if transport.dropped != dropped_seen:
+                DROPPED_FRAMES.inc(source_id, "transport", amount=transport.dropped - dropped_seen)
+                dropped_seen = transport.dropped
+            if max_age and age > max_age:
+                # latest frame wins: skip what is already too old rather than fall further behind
+                DROPPED_FRAMES.inc(source_id, "stale")
+                logger.debug(f"{source_id} - dropping frame {age:.1f}s old")
                 continue
+            if packet.offset != offset or packet.scale != scale:
+                # frame is an ROI crop and/or a downscaled feed: move config coordinates into its space
+                offset, scale = packet.offset, packet.scale
+                local_bbox = to_local_bbox(bbox, offset, scale)
+                local_line_x = int((counting_line_x - offset[0]) * scale)
+                counter.counting_line_x = local_line_x
+                if voter:
+                    voter.bbox = local_bbox
 
-            # barcode
-            barcode, croped = process_frame_for_barcode(frame, bbox)
-            if barcode and last_saved_barcodes.get(source_id) != barcode:
-                frame_datetime = datetime.fromtimestamp(timestamp, tz=ZoneInfo("Asia/Tehran"))
-                logger.info(f"🟢 Detected new barcode: {barcode} from {source_type} in {source_id}")
-                save_image_to_folder(croped, barcode)
-                db_logger.log_barcode(source_id, barcode, frame_datetime, compressed_frame, "")
-                last_saved_barcodes[source_id] = barcode
-            else:
-                logger.debug(f"Duplicate barcode {barcode} detected, skipping save.")
+            run_yolo, run_ocr = scheduler.plan(age)
 
-            # ingot counting
-            count, sizes, widths, results = counter.process_frame(frame)
+            # ingot counting; crossings on frames the ladder skips are picked up on the next YOLO run
+            # (the counter compares against each track's last seen position, not the previous frame)
+            if run_yolo:
+                t0 = time.perf_counter()
+                count, sizes, widths, tracks = counter.process_frame(frame, timestamp)
+                observe_stage(source_id, "yolo", time.perf_counter() - t0)
+            else:
+                count, sizes, widths, tracks = 0, [], [], None
             ingot_count += count
-            for box in (results[0].boxes if results and results[0].boxes else []):
-                x, y, w, h = box.xywh[0].tolist()
-                x1, y1 = int(x - w / 2), int(y - h / 2)
-                x2, y2 = int(x + w / 2), int(y + h / 2)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-            cv2.line(frame, (counting_line_x, 0), (counting_line_x, frame.shape[0]), (0, 255, 0), 2)
-            cv2.putText(frame, f"ingot_count: {ingot_count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
+
+            # barcode (first cut of the degradation ladder)
+            if voter:
+                if run_ocr:
+                    t0 = time.perf_counter()
+                    committed = voter.update(frame, tracks, timestamp, evidence=(packet, local_bbox))
+                    observe_stage(source_id, "ocr", time.perf_counter() - t0)
+                else:
+                    # no OCR, but tracks still age and expired ones still commit what they read
+                    committed = voter.skip(tracks, timestamp)
+                # a commit may come from an earlier frame (track expiry): log the frame it was read on
+                for track_id, barcode, croped, _, (read_packet, read_bbox) in committed:
+                    logger.info(f"🟢 Committed barcode {barcode} for track {track_id} from {source_type} in {source_id}")
+                    EVENTS_TOTAL.inc(source_id, "barcode")
+                    log_packet_barcode(image_sink, db_logger, source_id, barcode, read_packet, read_bbox, bbox)
+                    save_image_to_folder(image_sink, source_id, croped, barcode)
+            elif run_ocr:
+                t0 = time.perf_counter()
+                barcode, croped = process_frame_for_barcode(frame, local_bbox, ocr_gate)
+                observe_stage(source_id, "ocr", time.perf_counter() - t0)
+                if barcode and last_saved_barcodes.get(source_id) != barcode:
+                    logger.info(f"🟢 Detected new barcode: {barcode} from {source_type} in {source_id}")
+                    EVENTS_TOTAL.inc(source_id, "barcode")
+                    log_packet_barcode(image_sink, db_logger, source_id, barcode, packet, local_bbox, bbox)
+                    save_image_to_folder(image_sink, source_id, croped, barcode)
+                    last_saved_barcodes[source_id] = barcode
+                else:
+                    logger.debug(f"Duplicate barcode {barcode} detected, skipping save.")
 
             frame_count += 1
+            if frame_count == 1:
+                first_frame_seconds = time.time() - consumer_started
+                COMPONENT_GAUGE.set(first_frame_seconds, "consumer", source_id, "first_frame_seconds")
+                logger.info(f"{source_id} first frame processed {first_frame_seconds:.1f}s after consumer start")
+            if frame_count % 100 == 0:
+                if ocr_gate:
+                    logger.info(f"{source_id} OCR gate: skipped {ocr_gate.skipped}, executed {ocr_gate.executed}")
+                logger.info(f"{source_id} DB writer: {db_logger.stats()}, frames dropped in {transport.name}: {transport.dropped}")
             if count > 0:
+                EVENTS_TOTAL.inc(source_id, "ingot", amount=count)
+                full = full_resolution_frame(source_id, packet)
+                # annotation and encoding run on the sink's threads; the file and the DB row share one JPEG,
+                # which is the producer's own when annotation is off and there is no full-resolution frame
+                # (otherwise the producer's JPEG is only what the DB row gets if the sink cannot make one)
+                jpeg, draw = packet.cached_jpeg(), None
+                if full is not None:
+                    evidence_frame, roi = full, bbox
+                    if settings.IMAGE_SINK_ANNOTATE:
+                        draw = partial(annotate, tracks=tracks_to_full(tracks, offset, scale),
+                                       counting_line_x=counting_line_x, ingot_count=ingot_count)
+                else:
+                    evidence_frame, roi = frame, local_bbox
+                    if settings.IMAGE_SINK_ANNOTATE:
+                        draw = partial(annotate, tracks=tracks, counting_line_x=local_line_x, ingot_count=ingot_count)
                 frame_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
-                cv2.imwrite(frame_path, frame)
-                logger.info(f"{source_id} saved frame {frame_count}, ingot_count = {ingot_count}")
                 frame_datetime = datetime.fromtimestamp(timestamp, tz=ZoneInfo("Asia/Tehran"))
-                # تبدیل فریم به داده باینری
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                frame_data = buffer.tobytes()
-                try:
-                    db_logger.log_ingot(source_id, sizes[0] if sizes else 0, widths[0] if widths else 0, frame_datetime, frame_data, "")
-                except Exception as db_error:
-                    logger.error(f"{source_id} - Database error: {db_error}")
-                    time.sleep(0.1)
-                    continue          
+                # sizes are measured in feed pixels; report them at full resolution
+                height = sizes[0] / scale if sizes else 0
+                width = widths[0] / scale if widths else 0
+                image_sink.submit(
+                    source_id, evidence_frame, path=frame_path, jpeg=jpeg, draw=draw, thumbnail_roi=roi,
+                    record=lambda data, thumbnail, height=height, width=width, frame_datetime=frame_datetime:
+                        db_logger.log_ingot(source_id, height, width, frame_datetime, data, "", thumbnail)
+                )
+                logger.info(f"{source_id} queued frame {frame_count}, ingot_count = {ingot_count}")
+            FRAMES_TOTAL.inc(source_id, "consumer")
+            observe_stage(source_id, "end_to_end", time.time() - timestamp)
             elapsed = time.time() - t_start
-            if elapsed < target_time:
+            scheduler.finished(elapsed)
+            if elapsed < target_time and scheduler.should_sleep(age + elapsed, target_time, transport.backlog()):
                 time.sleep(target_time - elapsed)
 
     except Exception as e:
         logger.error(f"Consumer {source_id} interrupted, shutting down and error: {e}")
     finally:
+        REGISTRY.remove_collector(collect_stats)
         try:
+            # images finish first: their DB rows go through db_logger
+            image_sink.close()
             db_logger.close()
-            rabbitmq_client.close()
+            transport.close()
+            counter.close()
         except Exception as e:
             logger.error(f"Error in frame consumer for {source_type} {source_id}: {e}")
\ No newline at end of file
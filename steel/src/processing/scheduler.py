@@ -0,0 +1,98 @@
+import logging
+from monitoring.metrics import COMPONENT_GAUGE, SCHEDULER_DECISIONS
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# degradation ladder; each level keeps the cuts of the ones below it
+FULL = 0
+SKIP_OCR = 1
+SPARSE_YOLO = 2
+LEVEL_NAMES = ("full", "skip_ocr", "sparse_yolo")
+
+
+class DeadlineScheduler:
+    """Decides per frame how much work the consumer can afford.
+
+    A frame should be finished within ``deadline`` seconds of capture. The
+    scheduler keeps a smoothed estimate of capture age plus processing time;
+    after ``hold_frames`` consecutive frames that would miss the deadline it
+    climbs one level of the ladder (skip OCR, then run YOLO only on every
+    ``yolo_stride``-th frame), and after ``hold_frames`` frames under half
+    the deadline it steps back down. The consumer only sleeps at full
+    quality with no backlog.
+    """
+
+    def __init__(self, source_id, deadline, yolo_stride=3, max_level=SPARSE_YOLO, hold_frames=10):
+        self.source_id = source_id
+        self.deadline = deadline
+        self.yolo_stride = max(1, yolo_stride)
+        self.max_level = max_level
+        self.hold_frames = hold_frames
+        self.level = FULL
+        self.lag = None
+        self.processing = 0.0
+        self._late = 0
+        self._early = 0
+        self._frame = 0
+        COMPONENT_GAUGE.set(self.level, "scheduler", source_id, "level")
+
+    def plan(self, age):
+        """Decide for a frame captured ``age`` seconds ago; returns (run_yolo, run_ocr)."""
+        expected = age + self.processing
+        self.lag = expected if self.lag is None else 0.8 * self.lag + 0.2 * expected
+        if self.lag > self.deadline:
+            self._late, self._early = self._late + 1, 0
+        elif self.lag < self.deadline / 2:
+            self._late, self._early = 0, self._early + 1
+        else:
+            self._late = self._early = 0
+        if self._late >= self.hold_frames and self.level < self.max_level:
+            self._set_level(self.level + 1)
+        elif self._early >= self.hold_frames and self.level > FULL:
+            self._set_level(self.level - 1)
+
+        self._frame += 1
+        run_ocr = self.level < SKIP_OCR
+        run_yolo = self.level < SPARSE_YOLO or self._frame % self.yolo_stride == 0
+        if not run_yolo:
+            SCHEDULER_DECISIONS.inc(self.source_id, "skip_yolo")
+        elif not run_ocr:
+            SCHEDULER_DECISIONS.inc(self.source_id, "skip_ocr")
+        else:
+            SCHEDULER_DECISIONS.inc(self.source_id, "full")
+        return run_yolo, run_ocr
+
+    def _set_level(self, level):
+        direction = "degrading" if level > self.level else "recovering"
+        logger.warning(
+            f"⚠️ {self.source_id} {direction} to {LEVEL_NAMES[level]} (lag {self.lag:.2f}s, deadline {self.deadline}s)"
+        )
+        self.level = level
+        self._late = self._early = 0
+        COMPONENT_GAUGE.set(level, "scheduler", self.source_id, "level")
+
+    def finished(self, seconds):
+        """Record how long the frame's processing took."""
+        self.processing = 0.8 * self.processing + 0.2 * seconds
+        COMPONENT_GAUGE.set(self.lag or 0.0, "scheduler", self.source_id, "lag_seconds")
+
+    def should_sleep(self, age, interval, backlog=None):
+        """Sleep out the frame interval only when nothing is waiting: full quality, a fresh
+        frame and no backlog (``None`` when the transport cannot tell)."""
+        if self.level == FULL and age <= interval and not backlog:
+            return True
+        SCHEDULER_DECISIONS.inc(self.source_id, "no_sleep")
+        return False
+
+
+def scheduler_for(source_id, source_info):
+    """The CONSUMER_* settings, overridden by the source's "deadline" dict."""
+    overrides = source_info.get("deadline", {})
+    return DeadlineScheduler(
+        source_id,
+        deadline=float(overrides.get("seconds", settings.CONSUMER_DEADLINE)),
+        yolo_stride=int(overrides.get("yolo_stride", settings.CONSUMER_YOLO_STRIDE)),
+        max_level=int(overrides.get("max_level", settings.CONSUMER_MAX_DEGRADATION)),
+        hold_frames=int(overrides.get("hold_frames", settings.CONSUMER_LADDER_HOLD_FRAMES)),
+    )
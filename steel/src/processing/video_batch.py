@@ -0,0 +1,241 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from zoneinfo import ZoneInfo
+
+import cv2
+from ai.barcode import ChangeGate, process_frame_for_barcode
+from ai.counter import IngotCounter
+from ai.track_barcodes import TrackBarcodeVoter
+from db.database import DatabaseLogger
+from db.image_sink import ImageSink
+from db.write_behind import WriteBehindLogger
+from monitoring.metrics import EVENTS_TOTAL, FRAMES_TOTAL, observe_stage
+from processing.frame_consumer import annotate, log_barcode_event, save_image_to_folder
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VideoBatchJob:
+    """Analyses an uploaded video offline, as fast as the CPU allows.
+
+    Unlike the live path there is no producer, broker or frame-rate sleep:
+    the job samples the file at ``sample_fps`` with ``grab()`` (frames that
+    are not needed are never decoded), runs YOLO on ``batch_size`` sampled
+    frames per forward pass, then does barcode OCR and logging for each
+    frame in order. ``status()`` reports progress, ETA and counts while the
+    job runs and after it ends.
+
+    The file may still be uploading: until ``upload_done`` is set, reaching
+    the end of the data waits for more and resumes at the same frame.
+    """
+
+    def __init__(self, processor_id, video_path, source_info=None, sample_fps=None, batch_size=None, upload_done=None):
+        source_info = source_info or {}
+        if upload_done is None:
+            upload_done = threading.Event()
+            upload_done.set()
+        self.upload_done = upload_done
+        self._opened_complete = False
+        self.processor_id = processor_id
+        self.video_path = video_path
+        self.sample_fps = sample_fps or settings.VIDEO_SAMPLE_FPS
+        self.batch_size = batch_size or settings.VIDEO_BATCH_SIZE
+        self.bbox = source_info.get('bbox', settings.DEFAULT_BBOX)
+        self.counting_line_x = source_info.get('counting_line_x', settings.DEFAULT_COUNTING_LINE_X)
+        self.barcode_mode = source_info.get('barcode_mode', settings.BARCODE_MODE)
+        self.state = "queued"
+        self.error = None
+        self.frames_total = 0
+        self.position = 0
+        self.frames_processed = 0
+        self.ingot_count = 0
+        self.barcodes = []
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def status(self):
+        with self._lock:
+            now = self.finished_at or time.time()
+            elapsed = now - self.started_at if self.started_at else 0.0
+            progress = min(1.0, self.position / self.frames_total) if self.frames_total else 0.0
+            eta = None
+            if self.state == "running" and self.position and self.frames_total:
+                eta = elapsed / self.position * (self.frames_total - self.position)
+            return {
+                "processor_id": self.processor_id,
+                "state": self.state,
+                "progress": round(progress, 4),
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": None if eta is None else round(eta, 1),
+                "frames_total": self.frames_total,
+                "frames_processed": self.frames_processed,
+                "processing_fps": round(self.frames_processed / elapsed, 2) if elapsed else 0.0,
+                "ingot_count": self.ingot_count,
+                "barcode_count": len(self.barcodes),
+                "barcodes": list(self.barcodes),
+                "error": self.error,
+            }
+
+    def _open(self, stop_event):
+        """Open the video, waiting while a partial upload is not readable yet; None if it never is."""
+        while not stop_event.is_set():
+            # an end of data seen on a capture opened after the upload finished is the real end
+            complete = self.upload_done.is_set()
+            cap = cv2.VideoCapture(self.video_path)
+            if cap.isOpened():
+                self._opened_complete = complete
+                self.frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+                return cap
+            cap.release()
+            if complete:
+                return None
+            self.upload_done.wait(settings.VIDEO_PARTIAL_POLL_SECONDS)
+        return None
+
+    def _sampled_frames(self, cap, video_fps, stop_event):
+        """Yield (frame index, video seconds, frame) at ``sample_fps``; skipped frames are grabbed but not decoded."""
+        step = max(1, int(round(video_fps / self.sample_fps))) if video_fps > 0 else 1
+        index = 0
+        try:
+            while not stop_event.is_set():
+                if index % step == 0:
+                    ok, frame = cap.read()
+                else:
+                    ok, frame = cap.grab(), None
+                if not ok:
+                    if self._opened_complete:
+                        return
+                    # caught up with the upload: wait for more data, then reopen at the same frame
+                    self.upload_done.wait(settings.VIDEO_PARTIAL_POLL_SECONDS)
+                    cap.release()
+                    cap = self._open(stop_event)
+                    if cap is None:
+                        return
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                    continue
+                index += 1
+                self.position = index
+                if frame is not None:
+                    yield index - 1, (index - 1) / video_fps if video_fps > 0 else 0.0, frame
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _batches(self, frames):
+        batch = []
+        for item in frames:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, stop_event):
+        self.state = "waiting"
+        cap = self._open(stop_event)
+        if cap is None:
+            self.state = "stopped" if stop_event.is_set() else "failed"
+            self.error = None if stop_event.is_set() else f"cannot open {self.video_path}"
+            logger.error(f"Video {self.processor_id}: {self.error or 'stopped before the video was readable'}")
+            return
+        video_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # wall-clock time the recording is assumed to start at, for event timestamps
+        base_time = time.time()
+        tz = ZoneInfo(settings.LOCAL_TIMEZONE)
+        output_dir = os.path.join(settings.FRAMES_PATH, self.processor_id)
+        os.makedirs(output_dir, exist_ok=True)
+
+        counter = IngotCounter(
+            model_path=settings.YOLO_WEIGHTS,
+            counting_line_x=self.counting_line_x,
+            rabbitmq_client=None,
+            queue_name=f"video_batch_{self.processor_id}",
+            match_threshold=5
+        )
+        if self.barcode_mode == 'track':
+            voter, gate = TrackBarcodeVoter(
+                self.bbox,
+                max_reads=settings.BARCODE_MAX_READS_PER_TRACK,
+                min_votes=settings.BARCODE_MIN_VOTES
+            ), None
+        else:
+            voter, gate = None, ChangeGate(threshold=settings.OCR_GATE_THRESHOLD)
+        db_logger = WriteBehindLogger(DatabaseLogger())
+        image_sink = ImageSink()
+        last_barcode = None
+
+        self.started_at = time.time()
+        self.state = "running"
+        logger.info(
+            f"Video {self.processor_id}: batch analysis of {self.frames_total} frames at {video_fps:.1f} fps, "
+            f"sampling {self.sample_fps} fps, batches of {self.batch_size}"
+        )
+        try:
+            for batch in self._batches(self._sampled_frames(cap, video_fps, stop_event)):
+                t0 = time.perf_counter()
+                results = counter.process_batch([frame for _, _, frame in batch], [offset_s for _, offset_s, _ in batch])
+                yolo_seconds = (time.perf_counter() - t0) / len(batch)
+
+                for (frame_index, offset_s, frame), (count, sizes, widths, tracks) in zip(batch, results):
+                    observe_stage(self.processor_id, "yolo", yolo_seconds)
+                    frame_datetime = datetime.fromtimestamp(base_time + offset_s, tz=tz)
+
+                    t0 = time.perf_counter()
+                    if voter:
+                        # an expired track commits the frame it was read on, not this one
+                        committed = [
+                            (barcode, crop, read_at, read_frame)
+                            for _, barcode, crop, read_at, read_frame in voter.update(frame, tracks, offset_s)
+                        ]
+                    else:
+                        barcode, crop = process_frame_for_barcode(frame, self.bbox, gate)
+                        committed = [(barcode, crop, offset_s, frame)] if barcode and barcode != last_barcode else []
+                    observe_stage(self.processor_id, "ocr", time.perf_counter() - t0)
+                    for barcode, crop, read_at, read_frame in committed:
+                        last_barcode = barcode
+                        EVENTS_TOTAL.inc(self.processor_id, "barcode")
+                        log_barcode_event(
+                            image_sink, db_logger, self.processor_id, barcode,
+                            datetime.fromtimestamp(base_time + read_at, tz=tz), read_frame, self.bbox
+                        )
+                        save_image_to_folder(image_sink, self.processor_id, crop, barcode)
+                        with self._lock:
+                            self.barcodes.append(barcode)
+
+                    if count > 0:
+                        EVENTS_TOTAL.inc(self.processor_id, "ingot", amount=count)
+                        with self._lock:
+                            self.ingot_count += count
+                        height, width = sizes[0], widths[0]
+                        image_sink.submit(
+                            self.processor_id, frame,
+                            path=os.path.join(output_dir, f"frame_{frame_index:06d}.jpg"),
+                            draw=partial(annotate, tracks=tracks, counting_line_x=self.counting_line_x,
+                                         ingot_count=self.ingot_count),
+                            thumbnail_roi=self.bbox,
+                            record=lambda data, thumbnail, height=height, width=width, frame_datetime=frame_datetime:
+                                db_logger.log_ingot(self.processor_id, height, width, frame_datetime, data, "", thumbnail)
+                        )
+                    FRAMES_TOTAL.inc(self.processor_id, "batch")
+                    with self._lock:
+                        self.frames_processed += 1
+            self.state = "stopped" if stop_event.is_set() else "completed"
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Video {self.processor_id}: batch analysis failed: {e}")
+        finally:
+            with self._lock:
+                self.finished_at = time.time()
+                if self.state == "completed":
+                    self.position = max(self.position, self.frames_total)
+            image_sink.close()
+            db_logger.close()
+            counter.close()
+            logger.info(f"Video {self.processor_id}: {self.state}, {self.status()}")
@@ -5,8 +5,15 @@ import time
 logger = logging.getLogger(__name__)
 from config.config import settings
 
+# errors after which the connection or channel is unusable and must be reopened
+CONNECTION_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.AMQPChannelError,
+    pika.exceptions.StreamLostError,
+)
+
 class RabbitMQClient:
-    def __init__(self, host, port, user, password):
+    def __init__(self, host, port, user, password, prefetch_count=None, ack_batch=None, confirm_delivery=None):
         self.credentials = pika.PlainCredentials(user, password)
         # heartbeat now an int
         self.parameters = pika.ConnectionParameters(
@@ -16,49 +23,140 @@ class RabbitMQClient:
             heartbeat=settings.RABBITMQ_HEARTBEAT,
             blocked_connection_timeout=300
         )
+        self.prefetch_count = prefetch_count or settings.RABBITMQ_PREFETCH
+        # acks are sent with multiple=True, so a batch must fit in the prefetch window
+        self.ack_batch = max(1, min(ack_batch or settings.RABBITMQ_ACK_BATCH, self.prefetch_count))
+        self.confirm_delivery = settings.RABBITMQ_PUBLISH_CONFIRMS if confirm_delivery is None else confirm_delivery
         self.connection = None
         self.channel = None
+        self._declared = set()
+        # per-queue x-max-length given to declare_queue, reused when redeclaring after a reconnect
+        self._max_lengths = {}
+        self._consumers = {}
+        self._unacked = 0
+        self._last_delivery_tag = None
 
     def connect(self):
         try:
             self.connection = pika.BlockingConnection(self.parameters)
-            self.channel = self.connection.channel()
-            # ensure consumer prefetch so we don't overload consumer
-            self.channel.basic_qos(prefetch_count=1)
-            logger.info("Connected to RabbitMQ, prefetch_count=1")
+            self._open_channel()
+            logger.info(f"Connected to RabbitMQ, prefetch_count={self.prefetch_count}, ack_batch={self.ack_batch}")
         except Exception as e:
             logger.error(f"RabbitMQ connection failed: {e}")
             time.sleep(5)
             raise
 
-    def declare_queue(self, queue_name):
-        if not self.connection or self.connection.is_closed:
+    def _open_channel(self):
+        self.channel = self.connection.channel()
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        if self.confirm_delivery:
+            self.channel.confirm_delivery()
+        # declarations, consumers and delivery tags belong to the old channel
+        self._declared.clear()
+        self._consumers.clear()
+        self._unacked = 0
+        self._last_delivery_tag = None
+
+    def _ensure_connected(self):
+        if not self.connection or self.connection.is_closed or not self.channel or self.channel.is_closed:
             self.connect()
+
+    def declare_queue(self, queue_name, max_length=None):
+        """Declare ``queue_name`` once per connection, keeping at most ``max_length`` messages (newest win)."""
+        if max_length:
+            self._max_lengths[queue_name] = max_length
+        self._ensure_connected()
+        if queue_name in self._declared:
+            return
         # Set max length and drop oldest when limit is reached
         args = {
-            'x-max-length': settings.RABBITMQ_QUEUE_MAXLEN,
+            'x-max-length': self._max_lengths.get(queue_name, settings.RABBITMQ_QUEUE_MAXLEN),
             'x-overflow': 'drop-head'
         }
-        self.channel.queue_declare(
-            queue=queue_name,
-            durable=True,
-            arguments=args
-        )
+        try:
+            self.channel.queue_declare(queue=queue_name, durable=True, arguments=args)
+        except pika.exceptions.ChannelClosedByBroker as e:
+            if e.reply_code != 406:
+                raise
+            # the queue exists with other limits; frames are disposable, so recreate it with these
+            logger.warning(f"Queue {queue_name} was declared with other arguments, recreating it with {args}")
+            self._open_channel()
+            self.channel.queue_delete(queue=queue_name)
+            self.channel.queue_declare(queue=queue_name, durable=True, arguments=args)
+        self._declared.add(queue_name)
 
-    def publish(self, queue_name, message):
-        self.declare_queue(queue_name)
+    def queue_depth(self, queue_name):
+        """Messages ready in ``queue_name`` (not counting ones delivered but unacked), or None if unknown."""
         try:
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=queue_name,
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                    expiration=str(int(60000))
+            self.declare_queue(queue_name)
+            return self.channel.queue_declare(queue=queue_name, passive=True).method.message_count
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Could not read depth of {queue_name}: {e}")
+            self._reconnect_quietly()
+            return None
+
+    def publish(self, queue_name, message, expiration_ms=60000):
+        """Publish ``message``; it expires after ``expiration_ms`` unless that is None or 0."""
+        for attempt in range(2):
+            try:
+                self.declare_queue(queue_name)
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key=queue_name,
+                    body=message,
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,
+                        expiration=str(int(expiration_ms)) if expiration_ms else None
+                    )
                 )
-            )
-        except pika.exceptions.UnroutableError:
-            logger.warning(f"Queue {queue_name} full, dropping frame.")
+                return
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError):
+                logger.warning(f"Queue {queue_name} full, dropping frame.")
+                return
+            except CONNECTION_ERRORS as e:
+                if attempt:
+                    raise
+                logger.warning(f"RabbitMQ publish to {queue_name} failed ({e}), reconnecting")
+                self.connect()
+
+    def consume(self, queue_name, timeout=0.05):
+        """Return the next pushed message body from ``queue_name``, or None after ``timeout`` seconds idle.
+
+        Messages are delivered with basic_consume up to the prefetch window
+        and acknowledged in batches of ``ack_batch``; pending acks are also
+        flushed whenever the queue goes idle.
+        """
+        try:
+            consumer = self._consumers.get(queue_name)
+            if consumer is None:
+                self.declare_queue(queue_name)
+                consumer = self.channel.consume(queue_name, inactivity_timeout=timeout)
+                self._consumers[queue_name] = consumer
+            method_frame, _, body = next(consumer)
+            if method_frame is None:
+                self._flush_acks()
+                return None
+            self._last_delivery_tag = method_frame.delivery_tag
+            self._unacked += 1
+            if self._unacked >= self.ack_batch:
+                self._flush_acks()
+            return body
+        except CONNECTION_ERRORS as e:
+            logger.error(f"Error consuming from {queue_name}: {e}, reconnecting")
+            self._reconnect_quietly()
+            return None
+
+    def _flush_acks(self):
+        if self._unacked:
+            self.channel.basic_ack(self._last_delivery_tag, multiple=True)
+            self._unacked = 0
+
+    def _reconnect_quietly(self):
+        try:
+            self.connect()
+        except Exception:
+            # connect() already logged and backed off; the next call retries
+            self.connection = None
 
     def basic_get(self, queue_name):
         try:
@@ -70,9 +168,15 @@ class RabbitMQClient:
             return None
         except Exception as e:
             logger.error(f"Error getting message: {e}")
-            self.connect()
+            self._reconnect_quietly()
             return None
 
     def close(self):
         if self.connection and self.connection.is_open:
+            try:
+                self._flush_acks()
+                if self._consumers:
+                    self.channel.cancel()
+            except CONNECTION_ERRORS as e:
+                logger.warning(f"Error flushing acks on close: {e}")
             self.connection.close()
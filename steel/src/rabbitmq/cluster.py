@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+import pika
+from rabbitmq.client import CONNECTION_ERRORS
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE = "steel.cluster"
+# AMQP reply code for declaring an exclusive queue another connection owns
+RESOURCE_LOCKED = 405
+
+
+class BrokerCoordinator:
+    """Cluster membership and leases on top of RabbitMQ.
+
+    A lease is an exclusive queue named after it: only one connection can
+    declare it, and the broker deletes it when that connection closes or
+    misses its heartbeats, so a crashed node's leases free themselves.
+    Nodes announce themselves on a fanout exchange; every node reads the
+    announcements from its own exclusive queue and treats a node as gone
+    after ``node_timeout`` seconds without one. Not thread-safe: one
+    ClusterNode thread drives it.
+    """
+
+    def __init__(self, node_id, node_timeout=None):
+        self.node_id = node_id
+        self.node_timeout = node_timeout or settings.CLUSTER_NODE_TIMEOUT
+        self.parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            credentials=pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS),
+            # leases die with the connection, so a dead node must be noticed quickly
+            heartbeat=settings.CLUSTER_BROKER_HEARTBEAT,
+        )
+        self.connection = None
+        self.channel = None
+        self._held = set()
+        self._seen = {}
+
+    def _connect(self):
+        self.connection = pika.BlockingConnection(self.parameters)
+        self.channel = self.connection.channel()
+        self.channel.exchange_declare(exchange=EXCHANGE, exchange_type="fanout")
+        inbox = f"steel.node.{self.node_id}"
+        self.channel.queue_declare(queue=inbox, exclusive=True)
+        self.channel.queue_bind(queue=inbox, exchange=EXCHANGE)
+        self._held = set()
+        logger.info(f"Cluster node {self.node_id} connected to RabbitMQ")
+
+    def renew(self):
+        """Leases still held. All of them are lost if the connection dropped; it is reopened for the next tick."""
+        if self.connection is None or self.connection.is_closed:
+            try:
+                self._connect()
+            except CONNECTION_ERRORS as e:
+                logger.error(f"❌ Cluster node {self.node_id} cannot reach RabbitMQ: {e}")
+                self.connection = None
+                return set()
+        try:
+            # services the connection heartbeat that keeps our exclusive queues alive
+            self.connection.process_data_events(0)
+        except CONNECTION_ERRORS as e:
+            logger.error(f"❌ Cluster node {self.node_id} lost its broker connection and all leases: {e}")
+            self.connection = None
+            self._held = set()
+        return set(self._held)
+
+    def acquire(self, name):
+        if name in self._held:
+            return True
+        try:
+            self.channel.queue_declare(queue=f"steel.lease.{name}", exclusive=True)
+        except pika.exceptions.ChannelClosedByBroker as e:
+            # the broker closes the channel, not the connection; our other leases survive
+            self.channel = self.connection.channel()
+            if e.reply_code == RESOURCE_LOCKED:
+                return False
+            raise
+        self._held.add(name)
+        return True
+
+    def release(self, name):
+        if name not in self._held:
+            # lost with the connection; deleting it now could hit another node's lease
+            return
+        self._held.discard(name)
+        try:
+            self.channel.queue_delete(queue=f"steel.lease.{name}")
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Could not release lease {name}: {e}")
+
+    def announce(self, info):
+        self.channel.basic_publish(
+            exchange=EXCHANGE,
+            routing_key="",
+            body=json.dumps(dict(info, node=self.node_id)),
+            properties=pika.BasicProperties(expiration=str(int(self.node_timeout * 1000))),
+        )
+
+    def members(self):
+        """{node_id: announced info plus age_seconds} of every node heard from within node_timeout."""
+        while True:
+            method, _, body = self.channel.basic_get(f"steel.node.{self.node_id}", auto_ack=True)
+            if method is None:
+                break
+            info = json.loads(body)
+            node = info.pop("node")
+            if info.get("leaving"):
+                self._seen.pop(node, None)
+            else:
+                self._seen[node] = (time.monotonic(), info)
+        now = time.monotonic()
+        for node in [n for n, (seen_at, _) in self._seen.items() if now - seen_at > self.node_timeout]:
+            del self._seen[node]
+        return {node: dict(info, age_seconds=round(now - seen_at, 1)) for node, (seen_at, info) in self._seen.items()}
+
+    def close(self):
+        if self.connection is None or self.connection.is_closed:
+            return
+        try:
+            self.announce({"leaving": True})
+            # closing the connection deletes the node's exclusive queues, i.e. releases every lease
+            self.connection.close()
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Error closing cluster connection: {e}")
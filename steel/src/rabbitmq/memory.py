@@ -0,0 +1,89 @@
+import threading
+import logging
+import time
+from collections import deque
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _MemoryQueue:
+    def __init__(self, maxlen):
+        self.messages = deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+
+class InMemoryBroker:
+    """Process-local stand-in for RabbitMQ queues (drop-head at their max length and per-message expiry, like the real ones)."""
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def queue(self, name, maxlen=None):
+        with self._lock:
+            q = self._queues.get(name)
+            if q is None:
+                q = self._queues[name] = _MemoryQueue(maxlen or settings.RABBITMQ_QUEUE_MAXLEN)
+            elif maxlen and maxlen != q.messages.maxlen:
+                with q.cond:
+                    q.messages = deque(q.messages, maxlen=maxlen)
+            return q
+
+
+default_broker = InMemoryBroker()
+
+
+class InMemoryRabbitMQClient:
+    """Drop-in for RabbitMQClient backed by an InMemoryBroker; used for benchmarks and local tests."""
+
+    def __init__(self, broker=None):
+        self.broker = broker or default_broker
+
+    def connect(self):
+        pass
+
+    def declare_queue(self, queue_name, max_length=None):
+        self.broker.queue(queue_name, max_length)
+
+    def queue_depth(self, queue_name):
+        return len(self.broker.queue(queue_name).messages)
+
+    def publish(self, queue_name, message, expiration_ms=60000):
+        q = self.broker.queue(queue_name)
+        with q.cond:
+            if len(q.messages) == q.messages.maxlen:
+                q.dropped += 1
+            expires_at = time.monotonic() + expiration_ms / 1000.0 if expiration_ms else float("inf")
+            q.messages.append((expires_at, message))
+            q.cond.notify()
+
+    def _pop_live(self, q):
+        now = time.monotonic()
+        while q.messages:
+            expires_at, message = q.messages.popleft()
+            if expires_at >= now:
+                return message
+            q.dropped += 1
+        return None
+
+    def consume(self, queue_name, timeout=0.05):
+        q = self.broker.queue(queue_name)
+        deadline = time.monotonic() + timeout
+        with q.cond:
+            while True:
+                message = self._pop_live(q)
+                if message is not None:
+                    return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not q.cond.wait_for(lambda: q.messages, remaining):
+                    return None
+
+    def basic_get(self, queue_name):
+        q = self.broker.queue(queue_name)
+        with q.cond:
+            return self._pop_live(q)
+
+    def close(self):
+        pass
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseBoard:
+    """Broker stand-in for cluster tests: leases with an expiry and node announcements.
+
+    Plays the part RabbitMQ plays for BrokerCoordinator, but leases are
+    timed instead of tied to a connection: a lease a node stops renewing is
+    free again after ``lease_seconds``, which is how a killed node's
+    cameras get released.
+    """
+
+    def __init__(self, lease_seconds):
+        self.lease_seconds = lease_seconds
+        self._leases = {}
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, node, name):
+        now = time.monotonic()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] != node and holder[1] > now:
+                return False
+            self._leases[name] = (node, now + self.lease_seconds)
+            return True
+
+    def renew(self, node):
+        now = time.monotonic()
+        with self._lock:
+            held = [name for name, (owner, expires) in self._leases.items() if owner == node and expires > now]
+            for name in held:
+                self._leases[name] = (node, now + self.lease_seconds)
+            return held
+
+    def release(self, node, name):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == node:
+                del self._leases[name]
+
+    def announce(self, node, info):
+        with self._lock:
+            if info.get("leaving"):
+                self._nodes.pop(node, None)
+                self._leases = {name: lease for name, lease in self._leases.items() if lease[0] != node}
+            else:
+                self._nodes[node] = (time.monotonic(), info)
+
+    def members(self, timeout):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                node: dict(info, age_seconds=round(now - seen_at, 1))
+                for node, (seen_at, info) in self._nodes.items() if now - seen_at <= timeout
+            }
+
+    def leases(self):
+        """{lease name: node} of every unexpired lease."""
+        now = time.monotonic()
+        with self._lock:
+            return {name: owner for name, (owner, expires) in self._leases.items() if expires > now}
+
+
+class StandInManager(BaseManager):
+    pass
+
+
+_board = None
+
+
+def _get_board():
+    return _board
+
+
+StandInManager.register("board", callable=_get_board)
+
+
+def serve_standin(host, port, authkey, lease_seconds):
+    """Run the stand-in until the process is killed."""
+    global _board
+    _board = LeaseBoard(lease_seconds)
+    manager = StandInManager(address=(host, port), authkey=authkey.encode())
+    logger.info(f"Broker stand-in listening on {host}:{port}, leases last {lease_seconds}s")
+    manager.get_server().serve_forever()
+
+
+def connect_board(address, authkey):
+    """Proxy to the LeaseBoard of a stand-in at "host:port"."""
+    host, port = address.rsplit(":", 1)
+    manager = StandInManager(address=(host, int(port)), authkey=authkey.encode())
+    manager.connect()
+    return manager.board()
+
+
+class StandInCoordinator:
+    """Same interface as BrokerCoordinator, against a LeaseBoard served by serve_standin."""
+
+    def __init__(self, node_id, address, authkey, node_timeout):
+        self.node_id = node_id
+        self.node_timeout = node_timeout
+        self.board = connect_board(address, authkey)
+
+    def renew(self):
+        return set(self.board.renew(self.node_id))
+
+    def acquire(self, name):
+        return self.board.acquire(self.node_id, name)
+
+    def release(self, name):
+        self.board.release(self.node_id, name)
+
+    def announce(self, info):
+        self.board.announce(self.node_id, info)
+
+    def members(self):
+        return self.board.members(self.node_timeout)
+
+    def close(self):
+        self.board.announce(self.node_id, {"leaving": True})
@@ -0,0 +1,49 @@
+from collections import namedtuple
+from config.config import settings
+
+BackpressurePolicy = namedtuple(
+    "BackpressurePolicy", ["max_depth", "max_age", "adaptive", "target_depth", "min_fps"]
+)
+
+
+def backpressure_policy(source_info=None):
+    """The BACKPRESSURE_* settings, overridden by the source's "backpressure" dict."""
+    overrides = (source_info or {}).get("backpressure", {})
+    return BackpressurePolicy(
+        max_depth=int(overrides.get("max_depth", settings.BACKPRESSURE_MAX_DEPTH)),
+        max_age=float(overrides.get("max_age", settings.BACKPRESSURE_MAX_AGE)),
+        adaptive=bool(overrides.get("adaptive", settings.BACKPRESSURE_ADAPTIVE)),
+        target_depth=int(overrides.get("target_depth", settings.BACKPRESSURE_TARGET_DEPTH)),
+        min_fps=float(overrides.get("min_fps", settings.BACKPRESSURE_MIN_FPS)),
+    )
+
+
+class RateController:
+    """Producer publish interval, adapted to how many frames the consumer has not taken yet.
+
+    Additive-increase/multiplicative-decrease in reverse: while the backlog
+    is above ``target_depth`` the interval grows by half per update, up to
+    1/min_fps; once the backlog is at or below half the target it shrinks
+    by a tenth per update back to the base rate. Without a backlog reading
+    (transport cannot tell) the current interval is kept.
+    """
+
+    def __init__(self, fps, policy):
+        self.base_interval = 1.0 / fps
+        self.max_interval = 1.0 / min(policy.min_fps, fps)
+        self.target_depth = policy.target_depth
+        self.enabled = policy.adaptive
+        self.interval = self.base_interval
+
+    def update(self, backlog):
+        if not self.enabled or backlog is None:
+            return self.interval
+        if backlog > self.target_depth:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        elif backlog * 2 <= self.target_depth:
+            self.interval = max(self.base_interval, self.interval * 0.9)
+        return self.interval
+
+    @property
+    def fps(self):
+        return 1.0 / self.interval
@@ -0,0 +1,58 @@
+import time
+import cv2
+
+
+class FramePacket:
+    """A frame handed from producer to consumer, plus its JPEG encoding when one exists."""
+
+    def __init__(self, frame, timestamp, jpeg=None, offset=(0, 0), seq=None, scale=1.0):
+        self.frame = frame
+        self.timestamp = timestamp
+        self._jpeg = jpeg
+        # top-left of the frame in full-resolution camera coordinates (non-zero when ROI cropped)
+        self.offset = offset
+        # feed pixels per full-resolution pixel (below 1 for substream / downscaled feeds)
+        self.scale = scale
+        self.seq = seq
+
+    def jpeg(self, quality=70):
+        """Return JPEG bytes for the frame, encoding at most once."""
+        if self._jpeg is None:
+            _, buffer = cv2.imencode('.jpg', self.frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            self._jpeg = buffer.tobytes()
+        elif isinstance(self._jpeg, memoryview):
+            # received payloads are views into the message; materialise only when an event needs them
+            self._jpeg = self._jpeg.tobytes()
+        return self._jpeg
+
+    def cached_jpeg(self):
+        """The JPEG the frame arrived with, or None; never encodes."""
+        if isinstance(self._jpeg, memoryview):
+            self._jpeg = self._jpeg.tobytes()
+        return self._jpeg
+
+
+class FrameTransport:
+    """Moves frames for one source from a producer to a consumer."""
+
+    name = "base"
+    # frames lost between send and receive, as far as this side can tell
+    dropped = 0
+
+    def send(self, frame, timestamp, offset=(0, 0), scale=1.0):
+        raise NotImplementedError
+
+    def receive(self, timeout=0.05):
+        """Return the next FramePacket, or None if nothing arrived within ``timeout`` seconds."""
+        raise NotImplementedError
+
+    def backlog(self):
+        """Frames sent but not yet received, or None when this transport cannot tell."""
+        return None
+
+    def backlog_reading(self):
+        """(backlog, time it was measured); a transport that caches its reading returns the same time until it refreshes."""
+        return self.backlog(), time.monotonic()
+
+    def close(self):
+        pass
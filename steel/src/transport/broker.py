@@ -0,0 +1,102 @@
+import logging
+import time
+import cv2
+import numpy as np
+from rabbitmq.client import RabbitMQClient
+from transport.base import FramePacket, FrameTransport
+from transport.backpressure import backpressure_policy
+from transport.envelope import ENC_JPEG, ENC_RAW_BGR, SequenceTracker, encode_envelope, parse_envelope
+from monitoring.metrics import observe_stage
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RabbitMQTransport(FrameTransport):
+    """JPEG-encodes frames and ships them through a RabbitMQ queue; works across hosts.
+
+    The queue is a conflating buffer: it keeps only the newest
+    ``policy.max_depth`` frames (drop-head) and each frame expires after
+    ``policy.max_age`` seconds (0 disables expiry, as it disables the
+    consumer's stale check), so an overloaded consumer never works
+    through a long backlog and the broker's memory stays bounded.
+    """
+
+    name = "rabbitmq"
+    # how long a queue depth reading is reused; backlog() is called for every published frame
+    BACKLOG_CACHE_SECONDS = 0.5
+
+    def __init__(self, source_id, client=None, policy=None):
+        self.source_id = source_id
+        self.queue_name = f"frame_queue_{source_id}"
+        self.policy = policy or backpressure_policy()
+        self.client = client or RabbitMQClient(
+            settings.RABBITMQ_HOST, settings.RABBITMQ_PORT,
+            settings.RABBITMQ_USER, settings.RABBITMQ_PASS,
+            # deliveries sitting in the prefetch window are not conflated, so keep it within the depth
+            prefetch_count=min(settings.RABBITMQ_PREFETCH, self.policy.max_depth)
+        )
+        self.client.connect()
+        self.client.declare_queue(self.queue_name, max_length=self.policy.max_depth)
+        self._seq = 0
+        self.sequence = SequenceTracker()
+        self._backlog = None
+        self._backlog_at = 0.0
+
+    @property
+    def dropped(self):
+        return self.sequence.dropped
+
+    def send(self, frame, timestamp, offset=(0, 0), scale=1.0):
+        t0 = time.perf_counter()
+        _, buffer_img = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        observe_stage(self.source_id, "encode", time.perf_counter() - t0)
+        self._seq += 1
+        h, w = frame.shape[:2]
+        message = encode_envelope(self.source_id, timestamp, self._seq, buffer_img.data,
+                                  encoding=ENC_JPEG, offset=offset, width=w, height=h, scale=scale)
+        self.client.publish(self.queue_name, message, expiration_ms=self.policy.max_age * 1000 or None)
+
+    def backlog(self):
+        return self.backlog_reading()[0]
+
+    def backlog_reading(self):
+        now = time.monotonic()
+        if now - self._backlog_at >= self.BACKLOG_CACHE_SECONDS:
+            self._backlog = self.client.queue_depth(self.queue_name)
+            self._backlog_at = now
+        return self._backlog, self._backlog_at
+
+    def receive(self, timeout=0.05):
+        msg = self.client.consume(self.queue_name, timeout)
+        if msg is None:
+            return None
+        try:
+            header, payload = parse_envelope(msg)
+        except ValueError as e:
+            logger.warning(f"{self.queue_name} - dropping message that is not a frame envelope: {e}")
+            return None
+        gap = self.sequence.observe(header.seq)
+        if gap:
+            logger.warning(f"{self.queue_name} - {gap} frames lost before seq {header.seq}")
+        t0 = time.perf_counter()
+        try:
+            buf = np.frombuffer(payload, np.uint8)
+            if header.encoding == ENC_RAW_BGR:
+                frame = buf.reshape((header.height, header.width, 3)).copy()
+                jpeg = None
+            else:
+                frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+                jpeg = payload
+        except (ValueError, cv2.error) as e:
+            # one bad message must not end the consumer
+            logger.warning(f"{self.queue_name} - dropping undecodable frame seq {header.seq}: {e}")
+            return None
+        observe_stage(self.source_id, "decode", time.perf_counter() - t0)
+        if frame is None:
+            logger.warning(f"{self.queue_name} - corrupted frame detected, Skipping...")
+            return None
+        return FramePacket(frame, header.timestamp, jpeg=jpeg, offset=header.offset, seq=header.seq, scale=header.scale)
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,84 @@
+import struct
+from collections import namedtuple
+
+MAGIC = b"STLF"
+VERSION = 2
+
+ENC_JPEG = 1
+ENC_RAW_BGR = 2
+ENCODINGS = (ENC_JPEG, ENC_RAW_BGR)
+
+# magic, version, encoding, camera id length, capture timestamp, sequence number,
+# ROI offset x/y, frame width/height, followed by the camera id and the payload
+_HEADER_V1 = struct.Struct("<4sBBHdQiiII")
+# v2 appends the feed scale (feed pixels per full-resolution pixel)
+_HEADER_V2 = struct.Struct("<4sBBHdQiiIIf")
+_HEADERS = {1: _HEADER_V1, 2: _HEADER_V2}
+
+EnvelopeHeader = namedtuple(
+    "EnvelopeHeader",
+    ["version", "encoding", "camera_id", "timestamp", "seq", "offset", "width", "height", "scale"]
+)
+
+
+def encode_envelope(camera_id, timestamp, seq, payload, encoding=ENC_JPEG, offset=(0, 0), width=0, height=0, scale=1.0):
+    """Build a frame message: a fixed binary header, the camera id, then the payload bytes."""
+    cam = camera_id.encode("utf-8")
+    header = _HEADER_V2.pack(MAGIC, VERSION, encoding, len(cam), timestamp, seq,
+                             offset[0], offset[1], width, height, scale)
+    return b"".join((header, cam, payload))
+
+
+def parse_envelope(body):
+    """Split a frame message into its header and a zero-copy memoryview of the payload.
+
+    Raises ValueError for anything that is not a supported envelope, so
+    arbitrary queue content is never deserialised: unknown versions or
+    encodings, a camera id running past the message, or a raw payload whose
+    length does not match the header's frame size.
+    """
+    view = memoryview(body)
+    if len(view) < _HEADER_V1.size or bytes(view[:4]) != MAGIC:
+        raise ValueError("not a frame envelope")
+    version = view[4]
+    layout = _HEADERS.get(version)
+    if layout is None or len(view) < layout.size:
+        raise ValueError(f"unsupported frame envelope version {version}")
+    fields = layout.unpack_from(view)
+    _, _, encoding, cam_len, timestamp, seq, off_x, off_y, width, height = fields[:10]
+    scale = fields[10] if version >= 2 else 1.0
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown frame encoding {encoding}")
+    start = layout.size + cam_len
+    if start > len(view):
+        raise ValueError(f"camera id length {cam_len} runs past the {len(view)} byte message")
+    camera_id = bytes(view[layout.size:start]).decode("utf-8")
+    payload = view[start:]
+    if encoding == ENC_RAW_BGR and len(payload) != width * height * 3:
+        raise ValueError(f"raw payload of {len(payload)} bytes does not match a {width}x{height} frame")
+    header = EnvelopeHeader(version, encoding, camera_id, timestamp, seq, (off_x, off_y), width, height, scale)
+    return header, payload
+
+
+class SequenceTracker:
+    """Counts frames lost between producer and consumer from envelope sequence numbers."""
+
+    def __init__(self):
+        self.last_seq = None
+        self.received = 0
+        self.dropped = 0
+        self.restarts = 0
+
+    def observe(self, seq):
+        """Record ``seq``; return how many frames were skipped just before it."""
+        self.received += 1
+        gap = 0
+        if self.last_seq is not None:
+            if seq > self.last_seq:
+                gap = seq - self.last_seq - 1
+            else:
+                # producer restarted and its counter began again
+                self.restarts += 1
+        self.dropped += gap
+        self.last_seq = seq
+        return gap
@@ -0,0 +1,25 @@
+from transport.backpressure import backpressure_policy
+from config.config import settings
+
+
+def create_transport(source_id, source_info=None):
+    """Build the frame transport configured for a source (per-camera ``transport`` or FRAME_TRANSPORT)."""
+    source_info = source_info or {}
+    kind = source_info.get("transport", settings.FRAME_TRANSPORT)
+    if kind == "shm":
+        from transport.shm import SharedMemoryTransport
+        return SharedMemoryTransport(
+            source_id,
+            source_info.get("width", settings.DEFAULT_FRAME_WIDTH),
+            source_info.get("height", settings.DEFAULT_FRAME_HEIGHT),
+            slots=settings.SHM_SLOTS
+        )
+    if kind == "rabbitmq":
+        from transport.broker import RabbitMQTransport
+        return RabbitMQTransport(source_id, policy=backpressure_policy(source_info))
+    if kind == "memory":
+        # broker code path (envelope, JPEG) against an in-process queue; for benchmarks and tests
+        from transport.broker import RabbitMQTransport
+        from rabbitmq.memory import InMemoryRabbitMQClient
+        return RabbitMQTransport(source_id, client=InMemoryRabbitMQClient(), policy=backpressure_policy(source_info))
+    raise ValueError(f"Unknown frame transport '{kind}' for {source_id}")
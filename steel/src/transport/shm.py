@@ -0,0 +1,172 @@
+import logging
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+from transport.base import FramePacket, FrameTransport
+
+logger = logging.getLogger(__name__)
+
+# per-slot metadata columns
+_SEQ, _TS, _H, _W, _OX, _OY, _SCALE = range(7)
+_META_COLS = 7
+_HEADER_BYTES = 64
+
+
+class SharedMemoryRing:
+    """Fixed-slot ring of raw BGR frames in a named shared-memory block.
+
+    The writer never blocks: when the reader falls behind by more than
+    ``slots`` frames the oldest ones are overwritten and counted as dropped.
+    Each slot carries its sequence number, which the reader checks before and
+    after copying (a seqlock), so a frame torn by a concurrent overwrite is
+    discarded instead of returned.
+    """
+
+    def __init__(self, name, max_width, max_height, slots=4):
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = max_width * max_height * 3
+        meta_bytes = slots * _META_COLS * 8
+        size = _HEADER_BYTES + meta_bytes + slots * self.slot_bytes
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._owner = True
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            if self.shm.size < size:
+                # left over from a previous run with a smaller geometry
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self._owner = True
+        buf = self.shm.buf
+        self._write_seq = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=0)
+        self._meta = np.ndarray((slots, _META_COLS), dtype=np.float64, buffer=buf, offset=_HEADER_BYTES)
+        self._data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=buf,
+                                offset=_HEADER_BYTES + meta_bytes)
+        if self._owner:
+            self._write_seq[0] = 0
+            self._meta[:, _SEQ] = -1
+        self._cond = threading.Condition()
+        self._read_seq = int(self._write_seq[0])
+        self.dropped = 0
+
+    def write(self, frame, timestamp, offset=(0, 0), scale=1.0):
+        h, w = frame.shape[:2]
+        nbytes = frame.size
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {w}x{h} does not fit shared-memory slot of {self.slot_bytes} bytes")
+        seq = int(self._write_seq[0]) + 1
+        slot = seq % self.slots
+        meta = self._meta[slot]
+        meta[_SEQ] = -1
+        self._data[slot, :nbytes] = frame.reshape(-1)
+        meta[_TS] = timestamp
+        meta[_H] = h
+        meta[_W] = w
+        meta[_OX], meta[_OY] = offset
+        meta[_SCALE] = scale
+        meta[_SEQ] = seq
+        with self._cond:
+            self._write_seq[0] = seq
+            self._cond.notify_all()
+
+    def read(self, timeout):
+        """Copy out the next unread frame; return (frame, timestamp, offset, scale, seq) or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: int(self._write_seq[0]) > self._read_seq, timeout):
+                return None
+        latest = int(self._write_seq[0])
+        oldest = latest - self.slots + 1
+        seq = self._read_seq + 1
+        if seq < oldest:
+            self.dropped += oldest - seq
+            seq = oldest
+        while seq <= latest:
+            slot = seq % self.slots
+            meta = self._meta[slot]
+            if int(meta[_SEQ]) == seq:
+                h, w = int(meta[_H]), int(meta[_W])
+                timestamp = float(meta[_TS])
+                offset = (int(meta[_OX]), int(meta[_OY]))
+                scale = float(meta[_SCALE])
+                frame = self._data[slot, :h * w * 3].reshape((h, w, 3)).copy()
+                if int(meta[_SEQ]) == seq:
+                    self._read_seq = seq
+                    return frame, timestamp, offset, scale, seq
+            # overwritten while we were looking at it
+            self.dropped += 1
+            seq += 1
+        self._read_seq = latest
+        return None
+
+    def backlog(self):
+        return min(self.slots, int(self._write_seq[0]) - self._read_seq)
+
+    def close(self):
+        del self._write_seq, self._meta, self._data
+        self.shm.close()
+        if self._owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+def get_ring(name, max_width, max_height, slots):
+    """Return the process-wide ring for ``name``, creating it on first use."""
+    with _rings_lock:
+        ring = _rings.get(name)
+        if ring is None:
+            ring = SharedMemoryRing(name, max_width, max_height, slots)
+            _rings[name] = [ring, 0]
+        else:
+            ring = ring[0]
+        _rings[name][1] += 1
+        return ring
+
+
+def release_ring(name):
+    with _rings_lock:
+        entry = _rings.get(name)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            entry[0].close()
+            del _rings[name]
+
+
+class SharedMemoryTransport(FrameTransport):
+    """Exchanges raw frames through a shared-memory ring, with no encode, decode or broker hop."""
+
+    name = "shm"
+
+    def __init__(self, source_id, max_width, max_height, slots=4):
+        self.ring_name = f"steel_frames_{source_id}"
+        self.ring = get_ring(self.ring_name, max_width, max_height, slots)
+
+    def send(self, frame, timestamp, offset=(0, 0), scale=1.0):
+        self.ring.write(frame, timestamp, offset, scale)
+
+    def receive(self, timeout=0.05):
+        item = self.ring.read(timeout)
+        if item is None:
+            return None
+        frame, timestamp, offset, scale, seq = item
+        return FramePacket(frame, timestamp, offset=offset, seq=seq, scale=scale)
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def backlog(self):
+        return self.ring.backlog()
+
+    def close(self):
+        release_ring(self.ring_name)